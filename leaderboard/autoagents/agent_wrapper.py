@@ -16,8 +16,9 @@ import time
 
 import carla
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.timer import GameTime
 
-from leaderboard.envs.sensor_interface import CallBack, OpenDriveMapReader, SpeedometerReader, SensorConfigurationInvalid
+from leaderboard.envs.sensor_interface import CallBack, BaseReader, OpenDriveMapReader, SpeedometerReader, SensorConfigurationInvalid
 from leaderboard.autoagents.autonomous_agent import Track
 
 MAX_ALLOWED_RADIUS_SENSOR = 3.0
@@ -61,12 +62,14 @@ class AgentWrapper(object):
 
     _agent = None
     _sensors_list = []
+    _pseudo_sensors_list = []
 
     def __init__(self, agent):
         """
         Set the autonomous agent
         """
         self._agent = agent
+        self._pseudo_sensors_list = []
 
     def __call__(self):
         """
@@ -169,11 +172,46 @@ class AgentWrapper(object):
 
             # setup callback
             sensor.listen(CallBack(sensor_spec['id'], sensor_spec['type'], sensor, self._agent.sensor_interface))
+            if 'buffer_size' in sensor_spec or 'overflow_policy' in sensor_spec:
+                self._agent.sensor_interface.set_overflow_policy(sensor_spec['id'],
+                                                                 sensor_spec.get('buffer_size'),
+                                                                 sensor_spec.get('overflow_policy'),
+                                                                 sensor_spec.get('overflow_timeout'))
             self._sensors_list.append(sensor)
+            if isinstance(sensor, BaseReader):
+                self._pseudo_sensors_list.append(sensor)
 
         # Tick once to spawn the sensors
         CarlaDataProvider.get_world().tick()
 
+    def tick_pseudo_sensors(self):
+        """
+        Let the pseudo sensors send their readings for the current tick.
+        Must be called after GameTime and CarlaDataProvider have been updated, before running the agent
+        """
+        frame = GameTime.get_frame()
+        game_time = GameTime.get_time()
+        for sensor in self._pseudo_sensors_list:
+            sensor.tick(frame, game_time)
+
+    def set_pipelined(self, pipelined):
+        """
+        Let the sensor interface know that the world is ticked while the agent runs,
+        see SensorInterface.set_pipelined
+        """
+        self._agent.sensor_interface.set_pipelined(pipelined)
+
+    def set_profiler(self, profiler):
+        """
+        Let the agent record its get_data and run_step phases in the TickProfiler
+        """
+        self._agent.profiler = profiler
+
+    def get_sensor_statistics(self):
+        """
+        Returns the latency statistics of each sensor, see SensorInterface.get_statistics
+        """
+        return self._agent.sensor_interface.get_statistics()
 
     @staticmethod
     def validate_sensor_configuration(sensors, agent_track, selected_track):
@@ -236,3 +274,5 @@ class AgentWrapper(object):
                 self._sensors_list[i].destroy()
                 self._sensors_list[i] = None
         self._sensors_list = []
+        self._agent.sensor_interface.set_recorder(None)
+        self._pseudo_sensors_list = []
@@ -10,6 +10,7 @@ This module provides the base class for all autonomous agents
 from __future__ import print_function
 
 from enum import Enum
+import time
 
 import carla
 from srunner.scenariomanager.timer import GameTime
@@ -32,6 +33,9 @@ class AutonomousAgent(object):
     Autonomous agent base class. All user agents have to be derived from this class
     """
 
+    # TickProfiler timing the get_data and run_step phases, set by the AgentWrapper
+    profiler = None
+
     def __init__(self, path_to_conf_file):
         self.track = Track.SENSORS
         #  current global plans to reach a destination
@@ -101,7 +105,10 @@ class AutonomousAgent(object):
         Execute the agent call, e.g. agent()
         Returns the next vehicle controls
         """
-        input_data = self.sensor_interface.get_data()
+        start = time.time()
+        input_data = self.sensor_interface.get_data(GameTime.get_frame())
+        if self.profiler is not None:
+            self.profiler.record('get_data', start)
 
         timestamp = GameTime.get_time()
 
@@ -112,8 +119,11 @@ class AutonomousAgent(object):
 
        # print('======[Agent] Wallclock_time = {} / {} / Sim_time = {} / {}x'.format(wallclock, wallclock_diff, timestamp, timestamp/(wallclock_diff+0.001)))
 
+        start = time.time()
         control = self.run_step(input_data, timestamp)
         control.manual_gear_shift = False
+        if self.profiler is not None:
+            self.profiler.record('run_step', start)
 
         return control
 
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a registry of the ego vehicles by role name. The world actors are scanned
+once to resolve a role, afterwards the liveness of the ego vehicle is checked against the
+snapshot of the tick.
+"""
+
+import time
+
+
+class EgoActorRegistry(object):
+
+    """
+    Resolves role names to vehicles. Each world actor is only inspected once: a scan only asks
+    the server for the actors that appeared in the world snapshot since the previous scan.
+    """
+
+    def __init__(self, world):
+        self._world = world
+        self._seen_ids = set()
+        self._actors = {}
+        self.scans = 0
+
+    def _scan(self):
+        self.scans += 1
+        new_ids = [actor_snapshot.id for actor_snapshot in self._world.get_snapshot()
+                   if actor_snapshot.id not in self._seen_ids]
+        if not new_ids:
+            return
+
+        self._seen_ids.update(new_ids)
+        for actor in self._world.get_actors(new_ids).filter('vehicle.*'):
+            role_name = actor.attributes.get('role_name', '')
+            if role_name and role_name not in self._actors:
+                self._actors[role_name] = actor
+
+    def get(self, role_name):
+        """
+        Returns the vehicle with the role name, None if there is none in the world
+        """
+        if role_name not in self._actors:
+            self._scan()
+        return self._actors.get(role_name)
+
+    def wait_for(self, role_names, timeout=None, initial_delay=0.05, max_delay=2.0):
+        """
+        Returns the vehicles with the role names, in order, waiting for the missing ones with an
+        exponential backoff. Raises a RuntimeError after timeout seconds, waits forever if None.
+        """
+        start_time = time.time()
+        delay = initial_delay
+        while True:
+            missing = [role_name for role_name in role_names if self.get(role_name) is None]
+            if not missing:
+                return [self._actors[role_name] for role_name in role_names]
+
+            if timeout is not None and time.time() - start_time + delay > timeout:
+                raise RuntimeError("Timeout while waiting for the ego vehicles {}".format(missing))
+            time.sleep(delay)
+            delay = min(2 * delay, max_delay)
+
+    def is_alive(self, role_name, snapshot):
+        """
+        Returns whether the vehicle resolved for the role name is part of the world snapshot
+        """
+        actor = self._actors.get(role_name)
+        if actor is None or not snapshot.has_actor(actor.id):
+            self._actors.pop(role_name, None)
+            return False
+        return True
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides the state of the ego vehicles at the current frame, read once per tick
+from the world snapshot and shared by the sensors, criteria and spectator of that tick.
+"""
+
+from collections import namedtuple
+import math
+
+import numpy as np
+
+
+def get_forward_speed(transform, velocity):
+    """ Convert the vehicle transform directly to forward speed """
+    vel_np = np.array([velocity.x, velocity.y, velocity.z])
+    pitch = np.deg2rad(transform.rotation.pitch)
+    yaw = np.deg2rad(transform.rotation.yaw)
+    orientation = np.array([np.cos(pitch) * np.cos(yaw), np.cos(pitch) * np.sin(yaw), np.sin(pitch)])
+    speed = np.dot(vel_np, orientation)
+    return speed
+
+
+class EgoState(namedtuple('EgoState', ['frame', 'transform', 'velocity', 'speed', 'forward_speed'])):
+
+    """
+    Immutable state of an ego vehicle at a given frame
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_snapshot(cls, snapshot, actor):
+        """
+        Builds the state of the actor from the world snapshot, None if the actor isn't part of it
+        """
+        actor_snapshot = snapshot.find(actor.id)
+        if actor_snapshot is None:
+            return None
+
+        transform = actor_snapshot.get_transform()
+        velocity = actor_snapshot.get_velocity()
+        speed = math.sqrt(velocity.x * velocity.x + velocity.y * velocity.y + velocity.z * velocity.z)
+        return cls(snapshot.frame, transform, velocity, speed, get_forward_speed(transform, velocity))
+
+
+class EgoStateProvider(object):
+
+    """
+    Holds the EgoState of each ego vehicle for the current tick.
+    on_carla_tick has to be called once per tick, after GameTime and CarlaDataProvider are updated.
+    """
+
+    _ego_states = {}
+
+    @staticmethod
+    def on_carla_tick(snapshot, ego_vehicles):
+        ego_states = {}
+        for ego_vehicle in ego_vehicles:
+            if ego_vehicle is None:
+                continue
+            ego_state = EgoState.from_snapshot(snapshot, ego_vehicle)
+            if ego_state is not None:
+                ego_states[ego_vehicle.id] = ego_state
+        EgoStateProvider._ego_states = ego_states
+
+    @staticmethod
+    def get_ego_state(actor):
+        """
+        Returns the state of the actor at the current tick, None if it isn't an ego vehicle
+        """
+        return EgoStateProvider._ego_states.get(actor.id)
+
+    @staticmethod
+    def get_hero_state():
+        """
+        Returns the state of the ego vehicle at the current tick, None unless there is exactly one
+        """
+        if len(EgoStateProvider._ego_states) != 1:
+            return None
+        return list(EgoStateProvider._ego_states.values())[0]
+
+    @staticmethod
+    def cleanup():
+        EgoStateProvider._ego_states = {}
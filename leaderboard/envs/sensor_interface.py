@@ -1,28 +1,15 @@
 import copy
+import hashlib
 import logging
 import numpy as np
 import os
 import time
-from threading import Thread
+from threading import Condition, Lock
 
-#from multiprocessing import Queue
-# from queue import Empty
-from queue import Queue
-from queue import Empty
-
-import carla
 from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
-from srunner.scenariomanager.timer import GameTime
-
 
-def threaded(fn):
-    def wrapper(*args, **kwargs):
-        thread = Thread(target=fn, args=args, kwargs=kwargs)
-        thread.setDaemon(True)
-        thread.start()
-
-        return thread
-    return wrapper
+from leaderboard.envs.ego_state import EgoStateProvider, get_forward_speed
+from leaderboard.utils.latency_histogram import LatencyHistogram
 
 
 class SensorConfigurationInvalid(Exception):
@@ -43,6 +30,15 @@ class SensorReceivedNoData(Exception):
         super(SensorReceivedNoData, self).__init__(message)
 
 
+def opendrive_digest(opendrive):
+    """
+    Content hash identifying an OpenDRIVE map, given either as text or as the bytes of a .xodr file
+    """
+    if not isinstance(opendrive, bytes):
+        opendrive = opendrive.encode('utf-8')
+    return hashlib.sha1(opendrive).hexdigest()
+
+
 class GenericMeasurement(object):
     def __init__(self, data, frame):
         self.data = data
@@ -50,33 +46,37 @@ class GenericMeasurement(object):
 
 
 class BaseReader(object):
+    """
+    Pseudo sensor, not spawned in the CARLA world but read on the simulation ticks it selects
+    """
+
+    # Tolerance when comparing game times, avoids skipping a tick due to floating point errors
+    TIME_TOLERANCE = 1e-6
+
     def __init__(self, vehicle, reading_frequency=1.0):
         self._vehicle = vehicle
         self._reading_frequency = reading_frequency
         self._callback = None
         self._run_ps = True
-        self.run()
+        self._next_reading_time = None
 
     def __call__(self):
         pass
 
-    @threaded
-    def run(self):
-        first_time = True
-        latest_time = GameTime.get_time()
-        while self._run_ps:
-            if self._callback is not None:
-                current_time = GameTime.get_time()
-
-                # Second part forces the sensors to send data at the first tick, regardless of frequency
-                if current_time - latest_time > (1 / self._reading_frequency) \
-                        or (first_time and GameTime.get_frame() != 0):
-                    self._callback(GenericMeasurement(self.__call__(), GameTime.get_frame()))
-                    latest_time = GameTime.get_time()
-                    first_time = False
-
-                else:
-                    time.sleep(0.001)
+    def tick(self, frame, game_time):
+        """
+        Called from the tick thread once the game time has been updated. Reads the sensor at the
+        first tick and then every 1 / reading_frequency seconds of game time. Readings returning
+        None have nothing new to report and aren't sent
+        """
+        if not self._run_ps or self._callback is None:
+            return
+
+        if self._next_reading_time is None or game_time + self.TIME_TOLERANCE >= self._next_reading_time:
+            data = self.__call__()
+            if data is not None:
+                self._callback(GenericMeasurement(data, frame))
+            self._next_reading_time = game_time + 1.0 / self._reading_frequency
 
     def listen(self, callback):
         # Tell that this function receives what the producer does.
@@ -102,16 +102,16 @@ class SpeedometerReader(BaseReader):
         if not transform:
             transform = self._vehicle.get_transform()
 
-        vel_np = np.array([velocity.x, velocity.y, velocity.z])
-        pitch = np.deg2rad(transform.rotation.pitch)
-        yaw = np.deg2rad(transform.rotation.yaw)
-        orientation = np.array([np.cos(pitch) * np.cos(yaw), np.cos(pitch) * np.sin(yaw), np.sin(pitch)])
-        speed = np.dot(vel_np, orientation)
-        return speed
+        return get_forward_speed(transform, velocity)
 
     def __call__(self):
         """ We convert the vehicle physics information into a convenient dictionary """
 
+        # Use the state shared by everything reading the ego during this tick
+        ego_state = EgoStateProvider.get_ego_state(self._vehicle)
+        if ego_state is not None:
+            return {'speed': ego_state.forward_speed}
+
         # protect this access against timeout
         attempts = 0
         while attempts < self.MAX_CONNECTION_ATTEMPTS:
@@ -128,45 +128,154 @@ class SpeedometerReader(BaseReader):
 
 
 class OpenDriveMapReader(BaseReader):
+    """
+    Sensor sending the OpenDRIVE map. The map is only fetched from the server when its name changes,
+    and only sent when its content does.
+    """
+
+    def __init__(self, vehicle, reading_frequency=1.0):
+        super(OpenDriveMapReader, self).__init__(vehicle, reading_frequency)
+        self._map_name = None
+        self._map_hash = None
+
     def __call__(self):
-        return {'opendrive': CarlaDataProvider.get_map().to_opendrive()}
+        carla_map = CarlaDataProvider.get_map()
+        if carla_map.name == self._map_name:
+            return None
+
+        opendrive = carla_map.to_opendrive()
+        map_hash = opendrive_digest(opendrive)
+        self._map_name = carla_map.name
+        if map_hash == self._map_hash:
+            return None
+
+        self._map_hash = map_hash
+        return {'opendrive': opendrive, 'map_name': carla_map.name, 'hash': map_hash}
+
+
+class BufferPool(object):
+    """
+    Preallocated arrays of a sensor, handed out per frame and given back once the agent
+    has consumed that frame. A pinned frame keeps its array until it is unpinned, even if
+    it is released in the meantime.
+    """
+
+    def __init__(self, shape, dtype, size=3):
+        self._shape = shape
+        self._dtype = dtype
+        self._free = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self._in_use = {}
+        self._pins = {}
+        self._released = set()
+        self._lock = Lock()
+
+    def acquire(self, frame):
+        with self._lock:
+            if frame in self._in_use:
+                return self._in_use[frame]
+
+            if self._free:
+                buffer = self._free.pop()
+            else:
+                # The agent is holding more frames than expected, grow the pool
+                buffer = np.empty(self._shape, dtype=self._dtype)
+            self._in_use[frame] = buffer
+
+        return buffer
+
+    def _release(self, frame):
+        if frame in self._pins:
+            self._released.add(frame)
+        else:
+            self._free.append(self._in_use.pop(frame))
+
+    def release(self, frame):
+        with self._lock:
+            if frame in self._in_use:
+                self._release(frame)
+
+    def release_before(self, frame):
+        with self._lock:
+            for used_frame in [f for f in self._in_use if f < frame]:
+                self._release(used_frame)
+
+    def pin(self, frame):
+        """
+        Keeps the array of the frame out of the pool until unpin is called as many times
+        """
+        with self._lock:
+            if frame in self._in_use:
+                self._pins[frame] = self._pins.get(frame, 0) + 1
+
+    def unpin(self, frame):
+        with self._lock:
+            if frame not in self._pins:
+                return
+            self._pins[frame] -= 1
+            if self._pins[frame] == 0:
+                del self._pins[frame]
+                if frame in self._released:
+                    self._released.discard(frame)
+                    self._free.append(self._in_use.pop(frame))
 
 
 class CallBack(object):
+    """
+    Parses the measurements of a sensor and hands them to the sensor interface.
+
+    The parser is chosen once, from the sensor type, in the _parsers table. A type without an entry
+    uses the one of its closest parent type, e.g. 'sensor.camera.rgb' is parsed as a 'sensor.camera'.
+    """
+
     def __init__(self, tag, sensor_type, sensor, data_provider):
         self._tag = tag
         self._data_provider = data_provider
+        self._buffer_pool = None
+        self._parser = self.get_parser(sensor_type)
 
         self._data_provider.register_sensor(tag, sensor_type, sensor)
 
     def __call__(self, data):
-        if isinstance(data, carla.libcarla.Image):
-            self._parse_image_cb(data, self._tag)
-        elif isinstance(data, carla.libcarla.LidarMeasurement):
-            self._parse_lidar_cb(data, self._tag)
-        elif isinstance(data, carla.libcarla.RadarMeasurement):
-            self._parse_radar_cb(data, self._tag)
-        elif isinstance(data, carla.libcarla.GnssMeasurement):
-            self._parse_gnss_cb(data, self._tag)
-        elif isinstance(data, carla.libcarla.IMUMeasurement):
-            self._parse_imu_cb(data, self._tag)
-        elif isinstance(data, GenericMeasurement):
-            self._parse_pseudosensor(data, self._tag)
-        else:
-            logging.error('No callback method for this sensor.')
+        received_time = time.time()
+        parsed_data = self._parser(self, data, self._tag)
+        if parsed_data is not None:
+            self._data_provider.update_sensor(self._tag, parsed_data, data.frame, received_time)
+
+    @classmethod
+    def register_parser(cls, sensor_type, parser):
+        """
+        Adds the parser of a sensor type. It is called as parser(callback, data, tag) and returns
+        the data handed to the agent, or None to discard the measurement
+        """
+        cls._parsers[sensor_type] = parser
+
+    @classmethod
+    def get_parser(cls, sensor_type):
+        parent_type = sensor_type
+        while parent_type:
+            if parent_type in cls._parsers:
+                return cls._parsers[parent_type]
+            parent_type = parent_type.rpartition('.')[0]
+
+        return cls._parse_unsupported
 
     # Parsing CARLA physical Sensors
     def _parse_image_cb(self, image, tag):
-        array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-        array = copy.deepcopy(array)
-        array = np.reshape(array, (image.height, image.width, 4))
-        self._data_provider.update_sensor(tag, array, image.frame)
+        if self._buffer_pool is None:
+            self._buffer_pool = BufferPool((image.height, image.width, 4), np.dtype("uint8"))
+            self._data_provider.register_buffer_pool(tag, self._buffer_pool)
+
+        # Single copy from the CARLA buffer into a pooled array
+        array = self._buffer_pool.acquire(image.frame)
+        raw = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
+        np.copyto(array, np.reshape(raw, (image.height, image.width, 4)))
+        return array
 
     def _parse_lidar_cb(self, lidar_data, tag):
         points = np.frombuffer(lidar_data.raw_data, dtype=np.dtype('f4'))
         points = copy.deepcopy(points)
         points = np.reshape(points, (int(points.shape[0] / 4), 4))
-        self._data_provider.update_sensor(tag, points, lidar_data.frame)
+        return points
 
     def _parse_radar_cb(self, radar_data, tag):
         # [depth, azimuth, altitute, velocity]
@@ -174,13 +283,13 @@ class CallBack(object):
         points = copy.deepcopy(points)
         points = np.reshape(points, (int(points.shape[0] / 4), 4))
         points = np.flip(points, 1)
-        self._data_provider.update_sensor(tag, points, radar_data.frame)
+        return points
 
     def _parse_gnss_cb(self, gnss_data, tag):
         array = np.array([gnss_data.latitude,
                           gnss_data.longitude,
                           gnss_data.altitude], dtype=np.float64)
-        self._data_provider.update_sensor(tag, array, gnss_data.frame)
+        return array
 
     def _parse_imu_cb(self, imu_data, tag):
         array = np.array([imu_data.accelerometer.x,
@@ -191,21 +300,95 @@ class CallBack(object):
                           imu_data.gyroscope.z,
                           imu_data.compass,
                          ], dtype=np.float64)
-        self._data_provider.update_sensor(tag, array, imu_data.frame)
+        return array
 
     def _parse_pseudosensor(self, package, tag):
-        self._data_provider.update_sensor(tag, package.data, package.frame)
+        return package.data
+
+    def _parse_unsupported(self, data, tag):
+        logging.error('No callback method for this sensor.')
+        return None
+
+    _parsers = {
+        'sensor.camera': _parse_image_cb,
+        'sensor.lidar.ray_cast': _parse_lidar_cb,
+        'sensor.other.radar': _parse_radar_cb,
+        'sensor.other.gnss': _parse_gnss_cb,
+        'sensor.other.imu': _parse_imu_cb,
+        'sensor.opendrive_map': _parse_pseudosensor,
+        'sensor.speedometer': _parse_pseudosensor,
+    }
+
+
+class SensorStatistics(object):
+    """
+    Timings of the readings of a sensor, from the CARLA callback until the agent gets them
+    """
+
+    def __init__(self):
+        # callback entry -> enqueue, enqueue -> dequeue and callback entry -> dequeue
+        self.parse_time = LatencyHistogram()
+        self.buffered_time = LatencyHistogram()
+        self.total_time = LatencyHistogram()
+
+        # Frames between the frame requested by the agent and the reading handed over for it
+        self.frame_lag = 0
+        self.max_frame_lag = 0
+        self.max_queue_depth = 0
+
+    def summary(self):
+        return {
+            'readings': self.total_time.count(),
+            'parse_ms': self.parse_time.summary(),
+            'buffered_ms': self.buffered_time.summary(),
+            'total_ms': self.total_time.summary(),
+            'frame_lag': self.frame_lag,
+            'max_frame_lag': self.max_frame_lag,
+            'max_queue_depth': self.max_queue_depth
+        }
 
 
 class SensorInterface(object):
+
+    # What to do with a new reading when the buffer of its sensor is full:
+    #   keep_latest: only the newest reading is kept, all the older ones are dropped
+    #   drop_oldest: the oldest reading is dropped to make room for the new one
+    #   block: the sensor callback waits for the agent to free a slot, dropping the new reading on timeout
+    OVERFLOW_POLICIES = ('keep_latest', 'drop_oldest', 'block')
+
+    DEFAULT_BUFFER_SIZE = 3
+    DEFAULT_OVERFLOW_POLICY = 'drop_oldest'
+    DEFAULT_OVERFLOW_TIMEOUT = 1.0
+
     def __init__(self):
         self._sensors_objects = {}
+        self._sensors_types = {}
+        # Per-tag slot buffers, indexed by the CARLA frame of each reading
         self._data_buffers = {}
-        self._new_data_buffers = Queue()
+        self._buffer_pools = {}
+        self._data_condition = Condition()
         self._queue_timeout = 10
 
+        # Last frame handed to the agent, readings at or before it are stale
+        self._last_frame = -1
+        # Number of readings per tag that did not belong to the requested frame
+        self._frame_skew = {}
+        self._statistics = {}
+
+        # Per-tag (size, policy, timeout) of the slot buffers and number of readings dropped on overflow
+        self._buffer_settings = {}
+        self._dropped = {}
+        # In pipelined mode the readings of the next frame arrive while the agent waits for the current one
+        self._pipelined = False
+
+        # Optional SensorRecorder, writing every reading received
+        self._recorder = None
+
         # Only sensor that doesn't get the data on tick, needs special treatment
         self._opendrive_tag = None
+        # Pseudo sensors only read on the ticks their frequency selects, their latest reading
+        # is handed over on the other ones
+        self._pseudo_tags = set()
 
 
     def register_sensor(self, tag, sensor_type, sensor):
@@ -213,30 +396,294 @@ class SensorInterface(object):
             raise SensorConfigurationInvalid("Duplicated sensor tag [{}]".format(tag))
 
         self._sensors_objects[tag] = sensor
+        self._sensors_types[tag] = sensor_type
+        self._data_buffers[tag] = {}
+        self._frame_skew[tag] = 0
+        self._statistics[tag] = SensorStatistics()
+        self._buffer_settings[tag] = (self.DEFAULT_BUFFER_SIZE, self.DEFAULT_OVERFLOW_POLICY,
+                                      self.DEFAULT_OVERFLOW_TIMEOUT)
+        self._dropped[tag] = 0
 
         if sensor_type == 'sensor.opendrive_map': 
             self._opendrive_tag = tag
-
-    def update_sensor(self, tag, data, timestamp):
+        elif sensor_type == 'sensor.speedometer':
+            self._pseudo_tags.add(tag)
+
+    def register_buffer_pool(self, tag, buffer_pool):
+        """
+        Registers the pool the sensor with the given tag takes its arrays from, so that they are
+        given back once the agent moves past their frame
+        """
+        self._buffer_pools[tag] = buffer_pool
+
+    def pin_data(self, tag, frame):
+        """
+        Keeps the array handed over for the given frame from being reused by the sensor, until
+        unpin_data is called. Used by agents still reading it after get_data moved to the next frame.
+        """
+        buffer_pool = self._buffer_pools.get(tag)
+        if buffer_pool is not None:
+            buffer_pool.pin(frame)
+
+    def unpin_data(self, tag, frame):
+        buffer_pool = self._buffer_pools.get(tag)
+        if buffer_pool is not None:
+            buffer_pool.unpin(frame)
+
+    def set_recorder(self, recorder):
+        """
+        Starts writing every reading received to the given SensorRecorder, None stops the current one
+        """
+        if self._recorder is not None:
+            self._recorder.close()
+
+        if recorder is not None:
+            for tag, sensor_type in self._sensors_types.items():
+                recorder.add_sensor(tag, sensor_type)
+        self._recorder = recorder
+
+    def set_overflow_policy(self, tag, buffer_size=None, policy=None, timeout=None):
+        """
+        Bounds the number of readings buffered for a sensor and sets what happens when it is reached,
+        see OVERFLOW_POLICIES
+        """
         if tag not in self._sensors_objects:
             raise SensorConfigurationInvalid("The sensor with tag [{}] has not been created!".format(tag))
 
-        self._new_data_buffers.put((tag, timestamp, data))
+        buffer_size = int(buffer_size) if buffer_size is not None else self.DEFAULT_BUFFER_SIZE
+        policy = policy if policy is not None else self.DEFAULT_OVERFLOW_POLICY
+        timeout = float(timeout) if timeout is not None else self.DEFAULT_OVERFLOW_TIMEOUT
+        if buffer_size < 1:
+            raise SensorConfigurationInvalid("The buffer of sensor [{}] needs at least one slot".format(tag))
+        if policy not in self.OVERFLOW_POLICIES:
+            raise SensorConfigurationInvalid("Unknown overflow policy [{}] for sensor [{}]".format(policy, tag))
+        if self._pipelined:
+            self._check_pipelined_policy(tag, buffer_size, policy)
+
+        with self._data_condition:
+            self._buffer_settings[tag] = (buffer_size, policy, timeout)
+
+    @staticmethod
+    def _check_pipelined_policy(tag, buffer_size, policy):
+        """
+        Ensures that a reading of the next frame can't drop the one of the frame the agent waits for
+        """
+        if policy == 'keep_latest':
+            raise SensorConfigurationInvalid("The overflow policy [keep_latest] of sensor [{}] can't be used "
+                                             "in pipelined mode".format(tag))
+        if policy == 'drop_oldest' and buffer_size < 2:
+            raise SensorConfigurationInvalid("The buffer of sensor [{}] needs at least two slots in pipelined "
+                                             "mode".format(tag))
+
+    def set_pipelined(self, pipelined):
+        """
+        Declares that the world is ticked while the agent runs, so that the readings of the next frame
+        may arrive before the agent got the current one. The overflow policies dropping them are rejected.
+        """
+        if pipelined:
+            for tag, (buffer_size, policy, _) in self._buffer_settings.items():
+                self._check_pipelined_policy(tag, buffer_size, policy)
+        self._pipelined = pipelined
+
+    def get_dropped(self):
+        """
+        Returns, per sensor tag, how many readings were dropped because its buffer was full
+        """
+        with self._data_condition:
+            return dict(self._dropped)
+
+    def _drop_slot(self, tag, frame):
+        del self._data_buffers[tag][frame]
+        if tag in self._buffer_pools:
+            self._buffer_pools[tag].release(frame)
+
+    def _pending_slots(self, tag):
+        """
+        Returns the frames of the slots of a tag not handed over yet. The slot a pseudo sensor keeps
+        to hand over again doesn't count toward its buffer size.
+        """
+        slots = self._data_buffers[tag]
+        if tag not in self._pseudo_tags:
+            return list(slots)
+        return [slot_frame for slot_frame in slots if slot_frame > self._last_frame]
+
+    def _make_room(self, tag, timestamp):
+        """
+        Applies the overflow policy of the sensor before adding a reading.
+        Returns False if the new reading has to be dropped
+        """
+        buffer_size, policy, timeout = self._buffer_settings[tag]
+        slots = self._data_buffers[tag]
+
+        if policy == 'keep_latest':
+            for slot_frame in [f for f in self._pending_slots(tag) if f < timestamp]:
+                self._drop_slot(tag, slot_frame)
+                self._dropped[tag] += 1
+            return True
+
+        if policy == 'block':
+            deadline = time.time() + timeout
+            while len(self._pending_slots(tag)) >= buffer_size and timestamp not in slots:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._dropped[tag] += 1
+                    return False
+                self._data_condition.wait(remaining)
+            return True
+
+        pending = self._pending_slots(tag)
+        while len(pending) >= buffer_size and timestamp not in slots:
+            self._drop_slot(tag, min(pending))
+            self._dropped[tag] += 1
+            pending = self._pending_slots(tag)
+        return True
+
+    def update_sensor(self, tag, data, timestamp, received_time=None):
+        if tag not in self._sensors_objects:
+            raise SensorConfigurationInvalid("The sensor with tag [{}] has not been created!".format(tag))
 
-    def get_data(self):
-        try: 
+        enqueue_time = time.time()
+        if received_time is None:
+            received_time = enqueue_time
+
+        if self._recorder is not None:
+            self._recorder.record(tag, data, timestamp, received_time)
+
+        with self._data_condition:
+            statistics = self._statistics[tag]
+            statistics.parse_time.add(enqueue_time - received_time)
+
+            if timestamp <= self._last_frame and tag != self._opendrive_tag:
+                # Arrived after its frame was already handed to the agent
+                self._frame_skew[tag] += 1
+                if tag in self._buffer_pools:
+                    self._buffer_pools[tag].release(timestamp)
+                return
+
+            if not self._make_room(tag, timestamp):
+                if tag in self._buffer_pools:
+                    self._buffer_pools[tag].release(timestamp)
+                return
+
+            self._data_buffers[tag][timestamp] = (data, received_time, enqueue_time)
+            statistics.max_queue_depth = max(statistics.max_queue_depth, len(self._data_buffers[tag]))
+            self._data_condition.notify_all()
+
+    def get_frame_skew(self):
+        """
+        Returns, per sensor tag, how many readings were dropped for not matching the requested frame
+        """
+        with self._data_condition:
+            return dict(self._frame_skew)
+
+    def get_statistics(self):
+        """
+        Returns, per sensor tag, the latency percentiles (in ms) of its readings, its current
+        queue depth and the frame lag of the readings handed to the agent
+        """
+        with self._data_condition:
+            statistics = {}
+            for tag, sensor_statistics in self._statistics.items():
+                statistics[tag] = sensor_statistics.summary()
+                statistics[tag]['queue_depth'] = len(self._data_buffers[tag])
+                statistics[tag]['frame_skew'] = self._frame_skew[tag]
+                statistics[tag]['dropped'] = self._dropped[tag]
+            return statistics
+
+    def _frame_ready(self, frame):
+        for tag, slots in self._data_buffers.items():
+            # Don't wait for the opendrive sensor
+            if tag == self._opendrive_tag or frame in slots:
+                continue
+            # A pseudo sensor only needs a reading of this frame or an earlier one
+            if tag not in self._pseudo_tags or not any(slot_frame < frame for slot_frame in slots):
+                return False
+        return True
+
+    def _pop_frame(self, tag, frame):
+        """
+        Removes all the slots of a tag up to the given frame, returning the slot of that frame
+        as (frame, data, received_time, enqueue_time) and the number of stale slots discarded.
+        The slot handed over by a pseudo sensor stays, to be handed over again until a newer one arrives.
+        """
+        slots = self._data_buffers[tag]
+        stale = sorted(slot_frame for slot_frame in slots if slot_frame < frame)
+
+        reading_frame = None
+        if frame in slots:
+            reading_frame = frame
+        elif (tag == self._opendrive_tag or tag in self._pseudo_tags) and stale:
+            # The map and pseudo sensors are only read from time to time, hand over their latest reading
+            reading_frame = stale.pop()
+
+        reading = None
+        if reading_frame is not None:
+            if tag in self._pseudo_tags:
+                reading = (reading_frame,) + slots[reading_frame]
+            else:
+                reading = (reading_frame,) + slots.pop(reading_frame)
+
+        for slot_frame in stale:
+            del slots[slot_frame]
+
+        return reading, len(stale)
+
+    def _drop_stale(self, frame):
+        """
+        Removes the readings older than the given frame, except for the opendrive one and the
+        latest reading of the pseudo sensors
+        """
+        for tag, slots in self._data_buffers.items():
+            if tag == self._opendrive_tag:
+                continue
+            stale = sorted(slot_frame for slot_frame in slots if slot_frame < frame)
+            if tag in self._pseudo_tags and frame not in slots:
+                stale = stale[:-1]
+            for slot_frame in stale:
+                del slots[slot_frame]
+            if tag not in self._pseudo_tags:
+                self._frame_skew[tag] += len(stale)
+
+    def get_data(self, frame):
+        """
+        Waits until every sensor has delivered its data for the given frame and returns it,
+        discarding any older reading still in the buffers
+        """
+        deadline = time.time() + self._queue_timeout
+
+        # The agent is done with every frame before this one
+        for buffer_pool in self._buffer_pools.values():
+            buffer_pool.release_before(frame)
+
+        with self._data_condition:
+            # Make room for the sensors blocked on a full buffer, before waiting for them
+            self._drop_stale(frame)
+            self._data_condition.notify_all()
+
+            while not self._frame_ready(frame):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise SensorReceivedNoData("A sensor took too long to send their data")
+                self._data_condition.wait(remaining)
+
+            dequeue_time = time.time()
             data_dict = {}
-            while len(data_dict.keys()) < len(self._sensors_objects.keys()):
-
-                # Don't wait for the opendrive sensor
-                if self._opendrive_tag and self._opendrive_tag not in data_dict.keys() \
-                        and len(self._sensors_objects.keys()) == len(data_dict.keys()) + 1:
-                    break
-
-                sensor_data = self._new_data_buffers.get(True, self._queue_timeout)
-                data_dict[sensor_data[0]] = ((sensor_data[1], sensor_data[2]))
-
-        except Empty:
-            raise SensorReceivedNoData("A sensor took too long to send their data")
+            for tag in self._data_buffers:
+                reading, stale_count = self._pop_frame(tag, frame)
+                if tag != self._opendrive_tag and tag not in self._pseudo_tags:
+                    self._frame_skew[tag] += stale_count
+                if reading is not None:
+                    reading_frame, data, received_time, enqueue_time = reading
+                    statistics = self._statistics[tag]
+                    statistics.frame_lag = frame - reading_frame
+                    statistics.max_frame_lag = max(statistics.max_frame_lag, statistics.frame_lag)
+                    if reading_frame == frame or tag not in self._pseudo_tags:
+                        statistics.buffered_time.add(dequeue_time - enqueue_time)
+                        statistics.total_time.add(dequeue_time - received_time)
+                    data_dict[tag] = (reading_frame, data)
+
+            self._last_frame = frame
+            # Wake up the sensors blocked on a full buffer
+            self._data_condition.notify_all()
 
         return data_dict
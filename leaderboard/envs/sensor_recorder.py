@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a recorder of the sensor streams received by a SensorInterface and a
+replayer feeding them back, so that agents can be profiled without a CARLA server.
+
+A recording is a directory with:
+    - sensors.json: the tag and type of every sensor
+    - <tag>.bin: the payloads of the sensor, one after the other
+    - <tag>.index: one JSON line per reading with its frame, wall time, and payload layout
+The replayer memory-maps the .bin files, so array readings are handed over without being copied.
+"""
+
+from collections import namedtuple
+import json
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+
+ReplayTimestamp = namedtuple('ReplayTimestamp', ['frame', 'elapsed_seconds', 'delta_seconds'])
+
+
+class SensorRecorder(object):
+
+    """
+    Writes every reading given to SensorInterface.update_sensor, see SensorInterface.set_recorder
+    """
+
+    def __init__(self, path):
+        self._path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self._sensors = {}
+        self._files = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def add_sensor(self, tag, sensor_type):
+        with self._lock:
+            self._sensors[tag] = sensor_type
+            self._locks[tag] = threading.Lock()
+            self._files[tag] = (open(os.path.join(self._path, '{}.bin'.format(tag)), 'wb'),
+                                open(os.path.join(self._path, '{}.index'.format(tag)), 'w'))
+
+            with open(os.path.join(self._path, 'sensors.json'), 'w') as fd:
+                json.dump({'sensors': self._sensors}, fd, indent=4, sort_keys=True)
+
+    def record(self, tag, data, frame, wall_time):
+        tag_lock = self._locks.get(tag)
+        if tag_lock is None:
+            return
+
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data)
+            payload = data.data
+            entry = {'kind': 'array', 'dtype': data.dtype.str, 'shape': list(data.shape), 'nbytes': data.nbytes}
+        else:
+            payload = pickle.dumps(data, 2)
+            entry = {'kind': 'pickle', 'nbytes': len(payload)}
+        entry['frame'] = frame
+        entry['wall_time'] = wall_time
+
+        with tag_lock:
+            if tag not in self._files:
+                # closed in the meantime
+                return
+            data_file, index_file = self._files[tag]
+            entry['offset'] = data_file.tell()
+            data_file.write(payload)
+            index_file.write(json.dumps(entry, sort_keys=True) + '\n')
+
+    def close(self):
+        with self._lock:
+            for data_file, index_file in self._files.values():
+                data_file.close()
+                index_file.close()
+            self._files = {}
+            self._locks = {}
+
+
+class SensorReplayer(object):
+
+    """
+    Reads a recording made by the SensorRecorder and feeds it to a SensorInterface, frame by frame.
+
+    Only the frames with a reading of every sensor are replayed, as the agent would wait for the
+    missing ones (e.g. the last frame, when the recording stopped while it was being received).
+    The pseudo sensors (speedometer, OpenDRIVE map) are always fed, the SensorInterface hands
+    over their latest reading.
+    """
+
+    PSEUDO_SENSORS = ('sensor.speedometer', 'sensor.opendrive_map')
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'sensors.json')) as fd:
+            self._sensors = json.load(fd)['sensors']
+
+        self._data = {}
+        self._readings = {}
+        for tag in self._sensors:
+            data_path = os.path.join(path, '{}.bin'.format(tag))
+            if os.path.getsize(data_path) > 0:
+                self._data[tag] = np.memmap(data_path, dtype=np.uint8, mode='r')
+
+            with open(os.path.join(path, '{}.index'.format(tag))) as fd:
+                for line in fd:
+                    entry = json.loads(line)
+                    self._readings.setdefault(entry['frame'], []).append((tag, entry))
+
+        sensor_tags = set(tag for tag, sensor_type in self._sensors.items() if sensor_type not in self.PSEUDO_SENSORS)
+        self._frames = [frame for frame in sorted(self._readings)
+                        if sensor_tags.issubset(tag for tag, _ in self._readings[frame])]
+        self._partial_frames = sorted(set(self._readings) - set(self._frames))
+
+    def sensors(self):
+        """
+        Returns the type of each recorded sensor, by tag
+        """
+        return dict(self._sensors)
+
+    def frames(self):
+        """
+        Returns the frames replayed, the ones with a reading of every sensor
+        """
+        return list(self._frames)
+
+    def partial_frames(self):
+        """
+        Returns the frames skipped as some sensors have no reading for them
+        """
+        return list(self._partial_frames)
+
+    def register_sensors(self, sensor_interface):
+        for tag, sensor_type in self._sensors.items():
+            sensor_interface.register_sensor(tag, sensor_type, None)
+
+    def _load(self, tag, entry):
+        if entry['nbytes'] == 0:
+            return np.empty(entry['shape'], dtype=np.dtype(entry['dtype']))
+
+        payload = self._data[tag][entry['offset']:entry['offset'] + entry['nbytes']]
+        if entry['kind'] == 'array':
+            return payload.view(np.dtype(entry['dtype'])).reshape(entry['shape'])
+        return pickle.loads(payload.tobytes())
+
+    def replay(self, sensor_interface, realtime=False, delta_seconds=0.05):
+        """
+        Generator feeding the readings of each frame to the sensor interface, yielding a
+        ReplayTimestamp once a complete frame has been fed. With realtime, the readings are fed at the
+        pace they were recorded, otherwise as fast as possible.
+        """
+        if not self._frames:
+            return
+
+        complete_frames = set(self._frames)
+        first_frame = self._frames[0]
+        start_wall_time = None
+        start_time = time.time()
+        for frame in sorted(self._readings):
+            readings = self._readings[frame]
+            if frame not in complete_frames:
+                readings = [(tag, entry) for tag, entry in readings if self._sensors[tag] in self.PSEUDO_SENSORS]
+            for tag, entry in readings:
+                if realtime:
+                    if start_wall_time is None:
+                        start_wall_time = entry['wall_time']
+                    delay = (entry['wall_time'] - start_wall_time) - (time.time() - start_time)
+                    if delay > 0:
+                        time.sleep(delay)
+                sensor_interface.update_sensor(tag, self._load(tag, entry), frame)
+
+            if frame in complete_frames:
+                yield ReplayTimestamp(frame, (frame - first_frame + 1) * delta_seconds, delta_seconds)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a shared memory transport for large sensor payloads (images, point clouds),
+for a stack running on the same host. The payloads are written to a ring buffer in /dev/shm and
+only a std_msgs/Header announcing them goes through ROS.
+
+Segment layout, all integers little endian:
+
+    segment header (64 bytes)
+        0   char[8]   magic, "OPSHM001"
+        8   uint32    version, 1
+        12  uint32    slot_count
+        16  uint64    slot_size, maximum payload size of a slot in bytes
+        24  uint32    header_size, 64
+        28  uint32    slot_header_size, 64
+        32  padding
+    slot_count slots, slot i starting at header_size + i * (slot_header_size + slot_size)
+        slot header (64 bytes)
+            0   uint64    state, 2 * sequence + 1 while being written, 2 * sequence + 2 once written
+            8   uint64    frame, CARLA frame of the payload
+            16  uint32    stamp_secs
+            20  uint32    stamp_nsecs
+            24  uint64    payload_size
+            32  uint32    kind, 1 for an image, 2 for a point cloud
+            36  uint32    width, pixels of an image or points of a cloud
+            40  uint32    height, rows of an image, 1 for a cloud
+            44  uint32    step, bytes per row of an image, bytes per point of a cloud
+            48  char[16]  encoding of an image (sensor_msgs/Image encodings) or "xyzi32" for a cloud,
+                          zero padded
+        payload, slot_size bytes
+
+The point clouds are in the layout of the PointCloud2 messages of the bridge: x, y, z, intensity
+as float32, in the ROS convention.
+
+Writer protocol, for the payload number sequence (0, 1, 2...):
+    1. slot = sequence % slot_count
+    2. state = 2 * sequence + 1
+    3. write the slot header fields and the payload
+    4. state = 2 * sequence + 2
+    5. publish a std_msgs/Header with seq = sequence, stamp = payload stamp, frame_id = segment path
+
+Reader protocol, on each notification:
+    1. map the segment read only once, and check magic, version and header sizes
+    2. slot = seq % slot_count
+    3. load state (acquire); if it isn't 2 * seq + 2 the slot was overwritten or is being written,
+       drop the notification
+    4. copy the slot header fields and payload_size bytes of payload
+    5. memory fence, then load state again; if it changed the copy is torn, drop it
+
+The writer is the only process writing the segment, and creates it before the first notification.
+It removes the segment when the agent is destroyed.
+"""
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+
+SHM_MAGIC = b'OPSHM001'
+SHM_VERSION = 1
+SEGMENT_HEADER = struct.Struct('<8sIIQII')
+SLOT_HEADER = struct.Struct('<QQIIQIIII16s')
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 64
+STATE = struct.Struct('<Q')
+
+KIND_IMAGE = 1
+KIND_POINT_CLOUD = 2
+
+
+class ShmRingWriter(object):
+
+    """
+    Writes payloads into a ring of slot_count slots of a /dev/shm segment, see the module documentation
+    """
+
+    def __init__(self, path, slot_size, slot_count=4):
+        self.path = path
+        self.slot_size = int(slot_size)
+        self.slot_count = int(slot_count)
+        self._sequence = 0
+
+        size = HEADER_SIZE + self.slot_count * (SLOT_HEADER_SIZE + self.slot_size)
+        fd = os.open(path, os.O_CREAT | os.O_TRUNC | os.O_RDWR, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+        self._buffer = np.frombuffer(self._mmap, dtype=np.uint8)
+        SEGMENT_HEADER.pack_into(self._mmap, 0, SHM_MAGIC, SHM_VERSION, self.slot_count, self.slot_size,
+                                 HEADER_SIZE, SLOT_HEADER_SIZE)
+
+    def write(self, frame, stamp, kind, width, height, step, encoding, payload):
+        """
+        Copies the payload, a numpy array of any layout, in the next slot. stamp is a (secs, nsecs) pair.
+        Returns the sequence number of the payload, None if it doesn't fit in a slot.
+        """
+        payload_size = payload.nbytes
+        if payload_size > self.slot_size:
+            return None
+
+        sequence = self._sequence
+        offset = HEADER_SIZE + (sequence % self.slot_count) * (SLOT_HEADER_SIZE + self.slot_size)
+        STATE.pack_into(self._mmap, offset, 2 * sequence + 1)
+
+        SLOT_HEADER.pack_into(self._mmap, offset, 2 * sequence + 1, frame, stamp[0], stamp[1], payload_size,
+                              kind, width, height, step, encoding.encode('ascii'))
+        start = offset + SLOT_HEADER_SIZE
+        # a single copy, straight from the (possibly strided) array into the segment
+        destination = self._buffer[start:start + payload_size].view(payload.dtype).reshape(payload.shape)
+        np.copyto(destination, payload)
+
+        STATE.pack_into(self._mmap, offset, 2 * sequence + 2)
+        self._sequence += 1
+        return sequence
+
+    def close(self):
+        self._buffer = None
+        self._mmap.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ShmRingReader(object):
+
+    """
+    Reference implementation of the reader protocol, see the module documentation
+    """
+
+    def __init__(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self._mmap = mmap.mmap(fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+
+        magic, version, self.slot_count, self.slot_size, header_size, slot_header_size = \
+            SEGMENT_HEADER.unpack_from(self._mmap, 0)
+        if magic != SHM_MAGIC or version != SHM_VERSION or header_size != HEADER_SIZE or \
+                slot_header_size != SLOT_HEADER_SIZE:
+            self._mmap.close()
+            raise ValueError("{} isn't a version {} sensor segment".format(path, SHM_VERSION))
+
+    def read(self, sequence):
+        """
+        Returns the slot header fields and the payload bytes of the given sequence number,
+        None if it was overwritten
+        """
+        offset = HEADER_SIZE + (sequence % self.slot_count) * (SLOT_HEADER_SIZE + self.slot_size)
+        state = STATE.unpack_from(self._mmap, offset)[0]
+        if state != 2 * sequence + 2:
+            return None
+
+        fields = SLOT_HEADER.unpack_from(self._mmap, offset)
+        start = offset + SLOT_HEADER_SIZE
+        payload = self._mmap[start:start + fields[4]]
+
+        if STATE.unpack_from(self._mmap, offset)[0] != state:
+            return None
+
+        header = {'frame': fields[1], 'stamp': (fields[2], fields[3]), 'kind': fields[5], 'width': fields[6],
+                  'height': fields[7], 'step': fields[8], 'encoding': fields[9].rstrip(b'\0').decode('ascii')}
+        return header, payload
+
+    def close(self):
+        self._mmap.close()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides the spectator following the ego vehicle from above, with a policy
+deciding on which ticks it is moved:
+    - off: never
+    - every:N: every N ticks, every:1 being every tick
+    - distance:D: once the ego vehicle moved more than D metres from the last placement
+    - auto: off if the world doesn't render, every:1 otherwise
+"""
+
+import carla
+
+
+SPECTATOR_POLICIES = ('off', 'every', 'distance', 'auto')
+
+
+def parse_spectator_policy(policy):
+    """
+    Returns the (mode, value) pair of a policy string, raises a ValueError if it isn't valid
+    """
+    mode, _, value = policy.strip().lower().partition(':')
+    if mode not in SPECTATOR_POLICIES:
+        raise ValueError("Unknown spectator policy '{}', expected one of {}".format(policy, SPECTATOR_POLICIES))
+
+    if mode == 'every':
+        value = int(value) if value else 1
+        if value < 1:
+            raise ValueError("The spectator policy '{}' needs a positive number of ticks".format(policy))
+    elif mode == 'distance':
+        if not value:
+            raise ValueError("The spectator policy '{}' needs a distance".format(policy))
+        value = float(value)
+    else:
+        value = None
+    return mode, value
+
+
+class SpectatorFollower(object):
+
+    """
+    Places the spectator 50 m above the ego vehicle according to the policy.
+    Every call that doesn't move it saves the get_spectator and set_transform RPCs of a tick.
+    """
+
+    HEIGHT = 50
+
+    def __init__(self, world, policy='auto'):
+        self.policy = policy
+        self._mode, self._value = parse_spectator_policy(policy)
+        if self._mode == 'auto':
+            if world.get_settings().no_rendering_mode:
+                self._mode, self._value = 'off', None
+            else:
+                self._mode, self._value = 'every', 1
+
+        self._world = world
+        self._spectator = None
+        self._last_location = None
+        self._calls = 0
+        self._updates = 0
+
+    def follow(self, transform):
+        """
+        Called once per tick with the transform of the ego vehicle
+        """
+        self._calls += 1
+        if self._mode == 'off':
+            return
+        if self._mode == 'every' and (self._calls - 1) % self._value != 0:
+            return
+        if self._mode == 'distance' and self._last_location is not None and \
+                transform.location.distance(self._last_location) <= self._value:
+            return
+
+        if self._spectator is None:
+            self._spectator = self._world.get_spectator()
+        self._spectator.set_transform(carla.Transform(transform.location + carla.Location(z=self.HEIGHT),
+                                                      carla.Rotation(pitch=-90)))
+        self._last_location = transform.location
+        self._updates += 1
+
+    def get_statistics(self):
+        """
+        Returns the number of ticks, of spectator updates and of RPCs saved compared to
+        moving the spectator every tick
+        """
+        rpcs = self._updates + (1 if self._spectator is not None else 0)
+        return {'policy': self.policy, 'ticks': self._calls, 'updates': self._updates,
+                'rpcs_saved': 2 * self._calls - rpcs}
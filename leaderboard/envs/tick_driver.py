@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides the loop ticking a synchronous CARLA world, shared by the scenario manager
+and the bridge. The snapshots are received through the world on_tick callback instead of
+polling world.get_snapshot().
+"""
+
+import threading
+import time
+
+
+class TickDriver(object):
+
+    """
+    Runs a step function once per frame of the world, then ticks it.
+
+    The first step gets the current snapshot of the world, every following step gets the
+    snapshot of the frame returned by world.tick(). The loop ends once the step returns False
+    or stop() is called. wait_timeouts counts the waits for a snapshot that timed out before the
+    frame arrived.
+
+    A step may call start_tick() once it no longer needs the world to stay at its frame: the world
+    is then ticked in the background while the rest of the step runs (pipelined mode), and the
+    driver waits for that tick instead of ticking the world after the step.
+    """
+
+    def __init__(self, world, tick_timeout=None, wait_timeout=1.0, profiler=None):
+        """
+        tick_timeout is given to world.tick(), wait_timeout bounds a wait for a snapshot, after which
+        the stop flag is checked again. With a TickProfiler, world.tick() is recorded as the 'world_tick'
+        phase, and in pipelined mode the wait for the background tick after the step as 'tick_wait'.
+        """
+        self._world = world
+        self._profiler = profiler
+        self._tick_timeout = tick_timeout
+        self._wait_timeout = wait_timeout
+
+        self._condition = threading.Condition()
+        self._snapshot = None
+        self._running = False
+        self._tick_thread = None
+        self._tick_result = None
+
+        self.ticks = 0
+        self.wait_timeouts = 0
+
+    def _on_tick(self, snapshot):
+        with self._condition:
+            if self._snapshot is None or snapshot.frame > self._snapshot.frame:
+                self._snapshot = snapshot
+                self._condition.notify_all()
+
+    def _wait_for_frame(self, frame):
+        """
+        Returns the snapshot of the given frame (or a later one), None if stopped first
+        """
+        with self._condition:
+            while self._running:
+                if self._snapshot is not None and self._snapshot.frame >= frame:
+                    return self._snapshot
+                self._condition.wait(self._wait_timeout)
+                if self._snapshot is None or self._snapshot.frame < frame:
+                    # woken up by the timeout
+                    self.wait_timeouts += 1
+        return None
+
+    def _tick(self):
+        if self._tick_timeout is None:
+            return self._world.tick()
+        return self._world.tick(self._tick_timeout)
+
+    def _background_tick(self, start):
+        try:
+            self._tick_result = (self._tick(), None, start, time.time())
+        except Exception as e:  # pylint: disable=broad-except
+            self._tick_result = (None, e, start, time.time())
+
+    def start_tick(self):
+        """
+        Ticks the world in the background, to be called at most once per step
+        """
+        if self._tick_thread is not None:
+            raise RuntimeError("The world is already being ticked")
+
+        self._tick_thread = threading.Thread(target=self._background_tick, args=(time.time(),), name='world_tick')
+        self._tick_thread.daemon = True
+        self._tick_thread.start()
+
+    def _finish_tick(self):
+        """
+        Waits for the tick started by start_tick and returns its frame, raising its exception if any
+        """
+        wait_start = time.time()
+        tick_thread = self._tick_thread
+        tick_thread.join()
+        self._tick_thread = None
+        frame, error, start, end = self._tick_result
+        self._tick_result = None
+        if self._profiler is not None:
+            self._profiler.record('world_tick', start, end, tick_thread)
+            self._profiler.record('tick_wait', wait_start)
+        if error is not None:
+            raise error
+        return frame
+
+    def run(self, step):
+        """
+        Calls step(snapshot) once per frame until it returns False or stop() is called
+        """
+        self._running = True
+        callback_id = self._world.on_tick(self._on_tick)
+        try:
+            snapshot = self._world.get_snapshot()
+            self._on_tick(snapshot)
+            while snapshot is not None:
+                keep_running = step(snapshot) is not False and self._running
+
+                if self._tick_thread is not None:
+                    frame = self._finish_tick()
+                    self.ticks += 1
+                elif keep_running:
+                    tick_start = time.time()
+                    frame = self._tick()
+                    self.ticks += 1
+                    if self._profiler is not None:
+                        self._profiler.record('world_tick', tick_start)
+                if not keep_running:
+                    break
+
+                snapshot = self._wait_for_frame(frame)
+        finally:
+            if self._tick_thread is not None:
+                # the step raised after starting a tick
+                self._tick_thread.join()
+                self._tick_thread = None
+            self._running = False
+            self._world.remove_on_tick(callback_id)
+
+    def stop(self):
+        """
+        Ends the loop after the current step. It only sets a flag, so it can be called from a signal handler.
+        """
+        self._running = False
+
+    def is_running(self):
+        return self._running
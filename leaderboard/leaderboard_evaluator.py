@@ -31,7 +31,9 @@ from srunner.scenariomanager.watchdog import Watchdog
 
 from leaderboard.scenarios.scenario_manager import ScenarioManager
 from leaderboard.scenarios.route_scenario import RouteScenario
+from leaderboard.envs.actor_registry import EgoActorRegistry
 from leaderboard.envs.sensor_interface import SensorConfigurationInvalid
+from leaderboard.envs.sensor_recorder import SensorRecorder
 from leaderboard.autoagents.agent_wrapper import  AgentWrapper, AgentError
 from leaderboard.utils.statistics_manager import StatisticsManager
 from leaderboard.utils.route_indexer import RouteIndexer
@@ -107,7 +109,8 @@ class LeaderboardEvaluator(object):
         self.module_agent = importlib.import_module(module_name)
 
         # Create the ScenarioManager
-        self.manager = ScenarioManager(args.timeout, args.debug > 1)
+        self.manager = ScenarioManager(args.timeout, args.debug > 1, args.spectator, args.tick_profile,
+                                       args.pipelined)
 
         # Time control for summary purposes
         self._start_time = GameTime.get_time()
@@ -185,22 +188,9 @@ class LeaderboardEvaluator(object):
                                                                              color=vehicle.color,
                                                                              vehicle_category=vehicle.category))
 
-        else:            
-            ego_vehicle_missing = True
-            while ego_vehicle_missing:                
-                self.ego_vehicles = []
-                ego_vehicle_missing = False
-                for ego_vehicle in ego_vehicles:
-                    ego_vehicle_found = False
-                    carla_vehicles = CarlaDataProvider.get_world().get_actors().filter('vehicle.*')
-                    for carla_vehicle in carla_vehicles:
-                        if carla_vehicle.attributes['role_name'] == ego_vehicle.rolename:
-                            ego_vehicle_found = True
-                            self.ego_vehicles.append(carla_vehicle)
-                            break
-                    if not ego_vehicle_found:
-                        ego_vehicle_missing = True
-                        break
+        else:
+            actor_registry = EgoActorRegistry(CarlaDataProvider.get_world())
+            self.ego_vehicles = actor_registry.wait_for([vehicle.rolename for vehicle in ego_vehicles])
 
             for i, _ in enumerate(self.ego_vehicles):
                 self.ego_vehicles[i].set_transform(ego_vehicles[i].transform)
@@ -255,13 +245,26 @@ class LeaderboardEvaluator(object):
             config,
             self.manager.scenario_duration_system,
             self.manager.scenario_duration_game,
-            crash_message
+            crash_message,
+            self.manager.sensor_statistics,
+            self.manager.tick_statistics
         )
 
         print("\033[1m> Registering the route statistics\033[0m")
         self.statistics_manager.save_record(current_stats_record, config.index, checkpoint)
         self.statistics_manager.save_entry_status(entry_status, False, checkpoint)
 
+    def _save_tick_profile(self, config, checkpoint):
+        """
+        Writes the Chrome trace and the percentiles of the tick phases of the route next to the checkpoint
+        """
+        if self.manager.profiler is None or not self.manager.profiler.trace:
+            return
+
+        prefix = "{}_{}_rep{}".format(os.path.splitext(checkpoint)[0], config.name, config.repetition_index)
+        self.manager.profiler.write_trace(prefix + '.trace.json')
+        self.manager.profiler.write_statistics(prefix + '.phases.json')
+
     def _load_and_run_scenario(self, args, config):
         """
         Load and run the scenario given by config.
@@ -343,6 +346,9 @@ class LeaderboardEvaluator(object):
             if args.record:
                 self.client.start_recorder("{}/{}_rep{}.log".format(args.record, config.name, config.repetition_index))
             self.manager.load_scenario(scenario, self.agent_instance, config.repetition_index)
+            if args.record_sensors:
+                self.agent_instance.sensor_interface.set_recorder(SensorRecorder(
+                    "{}/{}_rep{}".format(args.record_sensors, config.name, config.repetition_index)))
 
         except Exception as e:
             # The scenario is wrong -> set the ejecution to crashed and stop
@@ -388,6 +394,7 @@ class LeaderboardEvaluator(object):
             print("\033[1m> Stopping the route\033[0m")
             self.manager.stop_scenario()
             self._register_statistics(config, args.checkpoint, entry_status, crash_message)
+            self._save_tick_profile(config, args.checkpoint)
 
             if args.record:
                 self.client.stop_recorder()
@@ -450,6 +457,19 @@ def main():
     parser.add_argument('--debug', type=int, help='Run with debug output', default=0)
     parser.add_argument('--record', type=str, default='',
                         help='Use CARLA recording feature to create a recording of the scenario')
+    parser.add_argument('--record-sensors', type=str, default='',
+                        help='Record the sensor streams received by the agent into this folder, see scripts/replay_sensor_stream.py')
+    parser.add_argument('--spectator', type=str, default='auto',
+                        help='When the spectator follows the ego vehicle: off, every:N ticks, distance:D metres, '
+                             'or auto, off without rendering and every tick otherwise (default: auto)')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='Tick the world while the agent runs: its control is applied one frame later, '
+                             'which is recorded in the route meta (tick/control_latency_frames). The sensors '
+                             'can\'t use the keep_latest overflow policy, nor drop_oldest with a single slot')
+    parser.add_argument('--tick-profile', action='store_true',
+                        help='Write the Chrome trace (<checkpoint>_<route>_rep<N>.trace.json) and the '
+                             'percentiles (.phases.json) of the tick phases of each route. The percentiles '
+                             'are always stored in the route meta (tick/phases)')
     parser.add_argument('--timeout', default="60.0",
                         help='Set the CARLA client timeout value in seconds')
 
@@ -40,9 +40,9 @@ from srunner.scenariomanager.scenarioatomics.atomic_criteria import (CollisionTe
                                                                      RouteCompletionTest,
                                                                      OutsideRouteLanesTest,
                                                                      RunningRedLightTest,
-                                                                     RunningStopTest,
-                                                                     ActorSpeedAboveThresholdTest)
+                                                                     RunningStopTest)
 
+from leaderboard.scenarios.scenarioatomics.atomic_criteria import ActorSpeedAboveThresholdTest
 from leaderboard.utils.route_parser import RouteParser, TRIGGER_THRESHOLD, TRIGGER_ANGLE_THRESHOLD
 from leaderboard.utils.route_manipulation import interpolate_trajectory
 
@@ -250,11 +250,7 @@ class RouteScenario(BasicScenario):
                                                           elevate_transform,
                                                           rolename='hero')
 
-        spectator = CarlaDataProvider.get_world().get_spectator()
-        ego_trans = ego_vehicle.get_transform()
-        spectator.set_transform(carla.Transform(ego_trans.location + carla.Location(z=50),
-                                                    carla.Rotation(pitch=-90)))
-
+        # The spectator is placed on the first tick, by the SpectatorFollower of the ScenarioManager
         return ego_vehicle
 
     def _estimate_route_timeout(self):
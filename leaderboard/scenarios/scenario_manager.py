@@ -23,8 +23,12 @@ from srunner.scenariomanager.timer import GameTime
 from srunner.scenariomanager.watchdog import Watchdog
 
 from leaderboard.autoagents.agent_wrapper import AgentWrapper, AgentError
+from leaderboard.envs.ego_state import EgoStateProvider
 from leaderboard.envs.sensor_interface import SensorReceivedNoData
+from leaderboard.envs.spectator import SpectatorFollower, parse_spectator_policy
+from leaderboard.envs.tick_driver import TickDriver
 from leaderboard.utils.result_writer import ResultOutputProvider
+from leaderboard.utils.tick_profiler import TickProfiler
 
 
 class ScenarioManager(object):
@@ -45,10 +49,11 @@ class ScenarioManager(object):
     """
 
 
-    def __init__(self, timeout, debug_mode=False):
+    def __init__(self, timeout, debug_mode=False, spectator_policy='auto', trace_ticks=False, pipelined=False):
         """
         Setups up the parameters, which will be filled at load_scenario()
         """
+        parse_spectator_policy(spectator_policy)
         self.scenario = None
         self.scenario_tree = None
         self.scenario_class = None
@@ -60,6 +65,13 @@ class ScenarioManager(object):
         self._running = False
         self._timestamp_last_run = 0.0
         self._timeout = float(timeout)
+        self._tick_driver = None
+        self._spectator_policy = spectator_policy
+        self._spectator = None
+        self._trace_ticks = trace_ticks
+        self.profiler = None
+        self._pipelined = pipelined
+        self._pending_control = None
 
         # Used to detect if the simulation is down
         watchdog_timeout = max(5, self._timeout - 2)
@@ -74,6 +86,8 @@ class ScenarioManager(object):
         self.start_system_time = None
         self.end_system_time = None
         self.end_game_time = None
+        self.sensor_statistics = {}
+        self.tick_statistics = {}
 
         # Register the scenario tick as callback for the CARLA world
         # Use the callback_id inside the signal handler to allow external interrupts
@@ -84,6 +98,8 @@ class ScenarioManager(object):
         Terminate scenario ticking when receiving a signal interrupt
         """
         self._running = False
+        if self._tick_driver is not None:
+            self._tick_driver.stop()
 
     def cleanup(self):
         """
@@ -95,6 +111,10 @@ class ScenarioManager(object):
         self.start_system_time = None
         self.end_system_time = None
         self.end_game_time = None
+        self.sensor_statistics = {}
+        self.tick_statistics = {}
+        self.profiler = None
+        EgoStateProvider.cleanup()
 
     def load_scenario(self, scenario, agent, rep_number):
         """
@@ -113,8 +133,13 @@ class ScenarioManager(object):
         # To print the scenario tree uncomment the next line
         # py_trees.display.render_dot_tree(self.scenario_tree)
 
+        self._agent.set_pipelined(self._pipelined)
         self._agent.setup_sensors(self.ego_vehicles[0], self._debug_mode)
 
+        # Time the phases of each tick, see TickProfiler
+        self.profiler = TickProfiler(trace=self._trace_ticks)
+        self._agent.set_profiler(self.profiler)
+
     def run_scenario(self):
         """
         Trigger the start of the scenario and wait for it to finish/fail
@@ -124,61 +149,100 @@ class ScenarioManager(object):
 
         self._watchdog.start()
         self._running = True
-
-        while self._running:
-            timestamp = None
-            world = CarlaDataProvider.get_world()
-            if world:
-                snapshot = world.get_snapshot()
-                if snapshot:
-                    timestamp = snapshot.timestamp
-            if timestamp:
-                self._tick_scenario(timestamp)
-
-    def _tick_scenario(self, timestamp):
+        self._pending_control = None
+
+        self._spectator = SpectatorFollower(CarlaDataProvider.get_world(), self._spectator_policy)
+        self._tick_driver = TickDriver(CarlaDataProvider.get_world(), self._timeout, profiler=self.profiler)
+        try:
+            self._tick_driver.run(self._tick_scenario)
+        finally:
+            self.tick_statistics = {'ticks': self._tick_driver.ticks,
+                                    'wait_timeouts': self._tick_driver.wait_timeouts,
+                                    'spectator': self._spectator.get_statistics(),
+                                    'pipelined': self._pipelined,
+                                    'control_latency_frames': 1 if self._pipelined else 0,
+                                    'phases': self.profiler.get_statistics()}
+            self._tick_driver = None
+
+    def _tick_scenario(self, snapshot):
         """
-        Run next tick of scenario and the agent and tick the world.
+        Run next tick of scenario and the agent. Returns whether the world has to be ticked.
+
+        In pipelined mode, the world tick is started once the scenario tree has been ticked, and runs
+        while the agent computes its control. That control is applied at the next tick, one frame later
+        than in the default mode.
         """
+        timestamp = snapshot.timestamp
 
         if self._timestamp_last_run < timestamp.elapsed_seconds and self._running:
             self._timestamp_last_run = timestamp.elapsed_seconds
+            profiler = self.profiler
+            tick_start = time.time()
 
             self._watchdog.update()
             # Update game time and actor information
             GameTime.on_carla_tick(timestamp)
             CarlaDataProvider.on_carla_tick()
-
-            try:
-                ego_action = self._agent()
-
-            # Special exception inside the agent that isn't caused by the agent
-            except SensorReceivedNoData as e:
-                raise RuntimeError(e)
-
-            except Exception as e:
-                raise AgentError(e)
-
-            self.ego_vehicles[0].apply_control(ego_action)
-
-            # Tick scenario
-            self.scenario_tree.tick_once()
-
-            if self._debug_mode:
-                print("\n")
-                py_trees.display.print_ascii_tree(
-                    self.scenario_tree, show_status=True)
-                sys.stdout.flush()
-
-            if self.scenario_tree.status != py_trees.common.Status.RUNNING:
-                self._running = False
-
-            spectator = CarlaDataProvider.get_world().get_spectator()
-            ego_trans = self.ego_vehicles[0].get_transform()
-            spectator.set_transform(carla.Transform(ego_trans.location + carla.Location(z=50),
-                                                        carla.Rotation(pitch=-90)))
-
-        if self._running and self.get_running_status():
-            CarlaDataProvider.get_world().tick(self._timeout)
+            EgoStateProvider.on_carla_tick(snapshot, self.ego_vehicles)
+            self._agent.tick_pseudo_sensors()
+            profiler.record('providers', tick_start)
+
+            if self._pipelined:
+                if self._pending_control is not None:
+                    self._apply_control(self._pending_control)
+                self._tick_scenario_tree()
+                self._update_spectator()
+
+                if self._running and self.get_running_status():
+                    self._tick_driver.start_tick()
+                self._pending_control = self._run_agent()
+            else:
+                self._apply_control(self._run_agent())
+                self._tick_scenario_tree()
+                self._update_spectator()
+
+            profiler.record('step', tick_start)
+
+        return self._running and self.get_running_status()
+
+    def _run_agent(self):
+        start = time.time()
+        try:
+            ego_action = self._agent()
+
+        # Special exception inside the agent that isn't caused by the agent
+        except SensorReceivedNoData as e:
+            raise RuntimeError(e)
+
+        except Exception as e:
+            raise AgentError(e)
+        self.profiler.record('agent', start)
+        return ego_action
+
+    def _apply_control(self, ego_action):
+        start = time.time()
+        self.ego_vehicles[0].apply_control(ego_action)
+        self.profiler.record('apply_control', start)
+
+    def _tick_scenario_tree(self):
+        start = time.time()
+        self.scenario_tree.tick_once()
+        self.profiler.record('scenario_tree', start)
+
+        if self._debug_mode:
+            print("\n")
+            py_trees.display.print_ascii_tree(
+                self.scenario_tree, show_status=True)
+            sys.stdout.flush()
+
+        if self.scenario_tree.status != py_trees.common.Status.RUNNING:
+            self._running = False
+
+    def _update_spectator(self):
+        start = time.time()
+        ego_state = EgoStateProvider.get_ego_state(self.ego_vehicles[0])
+        self._spectator.follow(ego_state.transform if ego_state else self.ego_vehicles[0].get_transform())
+        self.profiler.record('spectator', start)
 
     def get_running_status(self):
         """
@@ -204,6 +268,7 @@ class ScenarioManager(object):
                 self.scenario.terminate()
 
             if self._agent is not None:
+                self.sensor_statistics = self._agent.get_sensor_statistics()
                 self._agent.cleanup()
                 self._agent = None
 
@@ -21,6 +21,8 @@ from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
 from srunner.scenariomanager.scenarioatomics.atomic_criteria import Criterion
 from srunner.scenariomanager.traffic_events import TrafficEvent, TrafficEventType
 
+from leaderboard.envs.ego_state import EgoStateProvider
+
 
 class ActorSpeedAboveThresholdTest(Criterion):
     """
@@ -52,7 +54,11 @@ class ActorSpeedAboveThresholdTest(Criterion):
         """
         new_status = py_trees.common.Status.RUNNING
 
-        linear_speed = CarlaDataProvider.get_velocity(self._actor)
+        ego_state = EgoStateProvider.get_ego_state(self._actor)
+        if ego_state is not None:
+            linear_speed = ego_state.speed
+        else:
+            linear_speed = CarlaDataProvider.get_velocity(self._actor)
         if linear_speed is not None:
             if linear_speed < self._speed_threshold and self._time_last_valid_state:
                 if (GameTime.get_time() - self._time_last_valid_state) > self._below_threshold_max_time:
@@ -60,7 +66,10 @@ class ActorSpeedAboveThresholdTest(Criterion):
                     self.test_status = "FAILURE"
 
                     # record event
-                    vehicle_location = CarlaDataProvider.get_location(self._actor)
+                    if ego_state is not None:
+                        vehicle_location = ego_state.transform.location
+                    else:
+                        vehicle_location = CarlaDataProvider.get_location(self._actor)
                     blocked_event = TrafficEvent(event_type=TrafficEventType.VEHICLE_BLOCKED)
                     ActorSpeedAboveThresholdTest._set_event_message(blocked_event, vehicle_location)
                     ActorSpeedAboveThresholdTest._set_event_dict(blocked_event, vehicle_location)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a histogram of durations with a bounded memory footprint
+"""
+
+import bisect
+
+
+class LatencyHistogram(object):
+
+    """
+    Histogram of durations (in seconds) with logarithmic buckets.
+    Its size does not depend on the number of samples, percentiles are given with the
+    resolution of the buckets (about 26%).
+    """
+
+    # Upper bounds of the buckets, 10 per decade from 10 us to 100 s
+    BUCKET_BOUNDS = [1e-5 * 10 ** (i / 10.0) for i in range(71)]
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BUCKET_BOUNDS) + 1)
+        self._count = 0
+        self._max = 0.0
+
+    def add(self, value):
+        self._counts[bisect.bisect_left(self.BUCKET_BOUNDS, value)] += 1
+        self._count += 1
+        self._max = max(self._max, value)
+
+    def count(self):
+        return self._count
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket holding the given percentile, None if there are no samples
+        """
+        if not self._count:
+            return None
+
+        target = percent / 100.0 * self._count
+        cumulative = 0
+        for index, count in enumerate(self._counts):
+            cumulative += count
+            if cumulative >= target:
+                if index < len(self.BUCKET_BOUNDS):
+                    return min(self.BUCKET_BOUNDS[index], self._max)
+                return self._max
+
+        return self._max
+
+    def summary(self, scale=1000.0):
+        """
+        Returns the p50, p95, p99 and max of the samples, multiplied by scale (milliseconds by default)
+        """
+        percentiles = {}
+        for percent in (50, 95, 99):
+            value = self.percentile(percent)
+            percentiles['p{}'.format(percent)] = round(value * scale, 3) if value is not None else None
+        percentiles['max'] = round(self._max * scale, 3)
+        return percentiles
@@ -119,7 +119,8 @@ class StatisticsManager(object):
         """
         self._master_scenario = scenario
 
-    def compute_route_statistics(self, config, duration_time_system=-1, duration_time_game=-1, failure=""):
+    def compute_route_statistics(self, config, duration_time_system=-1, duration_time_game=-1, failure="",
+                                 sensor_statistics=None, tick_statistics=None):
         """
         Compute the current statistics by evaluating all relevant scenario criteria
         """
@@ -138,6 +139,10 @@ class StatisticsManager(object):
         route_record.meta['duration_system'] = duration_time_system
         route_record.meta['duration_game'] = duration_time_game
         route_record.meta['route_length'] = compute_route_length(config)
+        if sensor_statistics:
+            route_record.meta['sensors'] = sensor_statistics
+        if tick_statistics:
+            route_record.meta['tick'] = tick_statistics
 
         if self._master_scenario:
             if self._master_scenario.timeout_node.timeout:
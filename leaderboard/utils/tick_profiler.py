@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+This module provides a recorder of the duration of the phases of each tick (world tick, sensor
+data, agent step, scenario tree...), exported as a Chrome trace (chrome://tracing, Perfetto) and
+as percentiles per phase.
+"""
+
+from collections import deque
+import json
+import threading
+import time
+
+from leaderboard.utils.latency_histogram import LatencyHistogram
+
+
+class TickProfiler(object):
+
+    """
+    Records the durations of the spans in a LatencyHistogram per phase, which is a bucket increment
+    and a few KB per phase, so it can be left enabled. With trace, the spans are also kept as
+    (phase, start, duration, thread) tuples in a buffer of max_events, tens of MB once full, for the
+    Chrome trace. A disabled profiler ignores the spans.
+
+    A phase is timed with:
+        start = time.time()
+        ...
+        profiler.record('phase', start)
+    """
+
+    def __init__(self, enabled=True, trace=False, max_events=500000):
+        self.enabled = enabled
+        self.trace = enabled and trace
+        self._events = deque(maxlen=max_events)
+        self._histograms = {}
+        self._thread_names = {}
+        self.dropped = 0
+
+    def record(self, phase, start, end=None, thread=None):
+        """
+        Records a span of the phase from start to end (now by default), times as given by time.time().
+        The span is shown on the track of the thread it ran on, the calling thread by default.
+        """
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.time()
+        duration = end - start
+
+        if self.trace:
+            if thread is None:
+                thread = threading.current_thread()
+            if thread.ident not in self._thread_names:
+                self._thread_names[thread.ident] = thread.name
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append((phase, start, duration, thread.ident))
+
+        histogram = self._histograms.get(phase)
+        if histogram is None:
+            histogram = self._histograms[phase] = LatencyHistogram()
+        histogram.add(duration)
+
+    def get_statistics(self):
+        """
+        Returns the number of spans and the p50, p95, p99 and max durations (ms) of each phase
+        """
+        statistics = {}
+        for phase, histogram in self._histograms.items():
+            statistics[phase] = histogram.summary()
+            statistics[phase]['count'] = histogram.count()
+        return statistics
+
+    def write_trace(self, path):
+        """
+        Writes the recorded spans as a Chrome trace-event JSON file, empty unless trace is set.
+        Only the last max_events spans are kept, the percentiles cover all of them.
+        """
+        origin = self._events[0][1] if self._events else 0.0
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': ident, 'args': {'name': name}}
+                  for ident, name in self._thread_names.items()]
+        events.extend({'name': phase, 'ph': 'X', 'pid': 0, 'tid': ident,
+                       'ts': round((start - origin) * 1e6, 1), 'dur': round(duration * 1e6, 1)}
+                      for phase, start, duration, ident in self._events)
+
+        with open(path, 'w') as fd:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fd)
+
+    def write_statistics(self, path):
+        with open(path, 'w') as fd:
+            json.dump(self.get_statistics(), fd, indent=4, sort_keys=True)
@@ -16,20 +16,17 @@ from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
 from srunner.scenariomanager.timer import GameTime
 from srunner.scenariomanager.watchdog import Watchdog
 from leaderboard.autoagents.agent_wrapper import AgentWrapper, AgentError
+from leaderboard.envs.actor_registry import EgoActorRegistry
+from leaderboard.envs.ego_state import EgoStateProvider
 from leaderboard.envs.sensor_interface import SensorReceivedNoData
+from leaderboard.envs.sensor_recorder import SensorRecorder
+from leaderboard.envs.spectator import SpectatorFollower
+from leaderboard.envs.tick_driver import TickDriver
 from leaderboard.utils.result_writer import ResultOutputProvider
+from leaderboard.utils.tick_profiler import TickProfiler
 
 
 
-class BridgeHelpers(object):
-    @staticmethod
-    def get_agent_actor(world, role_name):
-        actors = world.get_actors().filter('*vehicle*')
-        for car in actors:
-            if car.attributes['role_name'] == role_name:
-                return car
-        return None
-
 class AgentLoop(object):
     
     def __init__(self):
@@ -38,7 +35,13 @@ class AgentLoop(object):
         self.debug_mode = False
         self.agent = None
         self.ego_vehicle = None
+        self.actor_registry = None
+        self.spectator = None
+        self.profiler = TickProfiler(False)
+        self.pipelined = False
+        self.pending_control = None
         self.running = False
+        self.tick_driver = None
         self.timestamp_last_run = 0.0
         self.timeout = 20.0
         self.role_name = 'hero'
@@ -48,36 +51,67 @@ class AgentLoop(object):
 
     def _stop_loop(self):
         self.running = False
+        if self.tick_driver is not None:
+            self.tick_driver.stop()
 
-
-    def _tick_agent(self, timestamp):                
+    def _tick_agent(self, snapshot):                
+        timestamp = snapshot.timestamp
         if self.timestamp_last_run < timestamp.elapsed_seconds and self.running:
             self.timestamp_last_run = timestamp.elapsed_seconds
+            profiler = self.profiler
+            tick_start = time.time()
             
             GameTime.on_carla_tick(timestamp)
             CarlaDataProvider.on_carla_tick()
+            EgoStateProvider.on_carla_tick(snapshot, [self.ego_vehicle])
+            self.agent.tick_pseudo_sensors()
+            profiler.record('providers', tick_start)
 
-            try:
-                ego_action = self.agent()
-            
-            except SensorReceivedNoData as e:
-                raise RuntimeError(e)
+            if self.pipelined:
+                # the world ticks while the agent runs, its control is applied at the next tick
+                if self.pending_control is not None:
+                    self._apply_control(self.pending_control)
+                self._check_ego_vehicle(snapshot)
+                self._update_spectator()
+                if self.running:
+                    self.tick_driver.start_tick()
+                self.pending_control = self._run_agent()
+            else:
+                self._apply_control(self._run_agent())
+                self._check_ego_vehicle(snapshot)
+                self._update_spectator()
 
-            except Exception as e:
-                raise AgentError(e)
+            profiler.record('step', tick_start)
 
-            self.ego_vehicle.apply_control(ego_action)            
-            
-            if BridgeHelpers.get_agent_actor(CarlaDataProvider.get_world(), self.role_name) is None:
-                self.running = False
+        return self.running
+
+    def _run_agent(self):
+        start = time.time()
+        try:
+            ego_action = self.agent()
+        
+        except SensorReceivedNoData as e:
+            raise RuntimeError(e)
+
+        except Exception as e:
+            raise AgentError(e)
+        self.profiler.record('agent', start)
+        return ego_action
+
+    def _apply_control(self, ego_action):
+        start = time.time()
+        self.ego_vehicle.apply_control(ego_action)
+        self.profiler.record('apply_control', start)
 
-            spectator = CarlaDataProvider.get_world().get_spectator()
-            ego_trans = self.ego_vehicle.get_transform()
-            spectator.set_transform(carla.Transform(ego_trans.location + carla.Location(z=50),
-                                                        carla.Rotation(pitch=-90)))
+    def _check_ego_vehicle(self, snapshot):
+        if not self.actor_registry.is_alive(self.role_name, snapshot):
+            self.running = False
 
-        if self.running:
-            CarlaDataProvider.get_world().tick()
+    def _update_spectator(self):
+        start = time.time()
+        ego_state = EgoStateProvider.get_ego_state(self.ego_vehicle)
+        self.spectator.follow(ego_state.transform if ego_state else self.ego_vehicle.get_transform())
+        self.profiler.record('spectator', start)
 
 class WorldHandler(object):
     def __init__(self):
@@ -125,6 +159,7 @@ class WorldHandler(object):
             print("Can't Load CARLA .. make sure that Simulator is running !!")  
 
     def _cleanup(self):
+        EgoStateProvider.cleanup()
         CarlaDataProvider.cleanup()                    
 
 class AgentHandler(object):
@@ -137,11 +172,17 @@ class AgentHandler(object):
         agent_class_name = getattr(module_agent, 'get_entry_point')()
         self.agent_instance = getattr(module_agent, agent_class_name)('')
         self._agent_wrapper = AgentWrapper(self.agent_instance)
-        self.ego_vehicle = BridgeHelpers.get_agent_actor(world_handler._world, self._agent_role_name)
+        self._actor_registry = EgoActorRegistry(world_handler._world)
+        self.ego_vehicle = self._actor_registry.get(self._agent_role_name)
         
         if self.ego_vehicle is not None:
             print("Ego Vehicle: " , self.ego_vehicle.attributes['role_name'])
             self._agent_wrapper.setup_sensors(self.ego_vehicle, False)
+
+            # Record the sensor streams, to replay them later with scripts/replay_sensor_stream.py
+            record_path = os.environ.get('OP_BRIDGE_RECORD_SENSORS', '')
+            if record_path:
+                self.agent_instance.sensor_interface.set_recorder(SensorRecorder(record_path))
             
             
             # # Set the vehicle dynamics (physics)
@@ -211,25 +252,37 @@ class AgentHandler(object):
             raise Exception("Can't initialize agent ego_vehicle ! ")
     
     def run_agent(self):
+        # OP_BRIDGE_TICK_PROFILE: path prefix of the Chrome trace and percentiles of the tick phases
+        profile_prefix = os.environ.get('OP_BRIDGE_TICK_PROFILE', '')
+        self.agent_loop = AgentLoop()
+        self.agent_loop.profiler = TickProfiler(trace=bool(profile_prefix))
         try:    
-            self.agent_loop = AgentLoop()
             self.agent_loop.agent = self._agent_wrapper
             self.agent_loop.ego_vehicle = self.ego_vehicle
+            self.agent_loop.actor_registry = self._actor_registry
+            # OP_BRIDGE_SPECTATOR: off, every:N, distance:D or auto, see leaderboard/envs/spectator.py
+            self.agent_loop.spectator = SpectatorFollower(CarlaDataProvider.get_world(),
+                                                          os.environ.get('OP_BRIDGE_SPECTATOR', 'auto'))
+            self._agent_wrapper.set_profiler(self.agent_loop.profiler)
+            # OP_BRIDGE_PIPELINED: tick the world while the agent publishes, its control is applied one frame later
+            self.agent_loop.pipelined = os.environ.get('OP_BRIDGE_PIPELINED', '').lower() in ('1', 'true')
+            self._agent_wrapper.set_pipelined(self.agent_loop.pipelined)
             self.agent_loop.start_system_time = time.time()
             self.agent_loop.start_game_time = GameTime.get_time()    
             self.agent_loop.role_name = self._agent_role_name            
             self.agent_loop.running = True    
-            while self.agent_loop.running:
-                timestamp = None
-                world = CarlaDataProvider.get_world()
-                if world:
-                    snapshot = world.get_snapshot()
-                    if snapshot:
-                        timestamp = snapshot.timestamp
-                if timestamp:
-                    self.agent_loop._tick_agent(timestamp)                
+            self.agent_loop.tick_driver = TickDriver(CarlaDataProvider.get_world(), profiler=self.agent_loop.profiler)
+            self.agent_loop.tick_driver.run(self.agent_loop._tick_agent)
+            print("Tick driver wait timeouts: ", self.agent_loop.tick_driver.wait_timeouts)
+            print("Spectator: ", self.agent_loop.spectator.get_statistics())
+            print("Control latency (frames): ", 1 if self.agent_loop.pipelined else 0)
         except Exception as e:        
             traceback.print_exc()
+
+        if self.agent_loop.profiler.trace:
+            self.agent_loop.profiler.write_trace(profile_prefix + '.trace.json')
+            self.agent_loop.profiler.write_statistics(profile_prefix + '.phases.json')
+        print("Tick phases (ms): ", self.agent_loop.profiler.get_statistics())
     
     def _stop_loop(self):
         self.agent_loop._stop_loop()
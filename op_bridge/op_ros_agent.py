@@ -9,29 +9,450 @@
 """
 This module provides a ROS autonomous agent interface to control the ego vehicle via a ROS stack
 """
+from collections import deque
 import math
 import os
 import subprocess
 import signal
+import tempfile
 import threading
 import time
+from queue import Queue
 import numpy
+import cv2
 import carla
-import tf
 import rospy
-from cv_bridge import CvBridge
-from geometry_msgs.msg import PoseStamped, TwistWithCovariance, TwistStamped
+from geometry_msgs.msg import PoseStamped, TwistStamped
 from nav_msgs.msg import Odometry, Path
 from rosgraph_msgs.msg import Clock
-from sensor_msgs.msg import Image, PointCloud2, NavSatFix, NavSatStatus, CameraInfo, Range, PointField, Imu
-from sensor_msgs.point_cloud2 import create_cloud_xyz32, create_cloud
+from sensor_msgs.msg import CompressedImage, Image, PointCloud2, NavSatFix, NavSatStatus, CameraInfo, Range, PointField, Imu
 from std_msgs.msg import Header, String
 from srunner.scenariomanager.carla_data_provider import *
 from leaderboard.autoagents.autonomous_agent import AutonomousAgent, Track
+from leaderboard.envs.ego_state import EgoStateProvider
+from leaderboard.envs.sensor_interface import opendrive_digest
+from leaderboard.envs.shm_transport import KIND_IMAGE, KIND_POINT_CLOUD, ShmRingWriter
 
 def get_entry_point():
     return 'RosAgent'
 
+def set_stamp(msg, timestamp, field='stamp'):
+    """
+    Sets the time field of msg (a Header stamp by default) in place, as rospy.Time.from_sec would
+    """
+    secs = int(timestamp)
+    stamp = getattr(msg, field)
+    stamp.secs = secs
+    stamp.nsecs = int((timestamp - secs) * 1000000000)
+
+LIDAR_POINT_FIELDS = [PointField('x', 0, PointField.FLOAT32, 1),
+                      PointField('y', 4, PointField.FLOAT32, 1),
+                      PointField('z', 8, PointField.FLOAT32, 1),
+                      PointField('intensity', 12, PointField.FLOAT32, 1)]
+
+# CARLA lidar points are expressed in a left handed coordinate system and ros needs a right handed one.
+# Permuting x and y already flips the handedness, so no axis has its sign changed.
+LIDAR_AXIS_ORDER = [1, 0, 2, 3]
+
+def lidar_to_point_cloud(header, lidar_data, msg=None):
+    """
+    Converts the (N, 4) CARLA lidar points to a PointCloud2 message, msg if given.
+
+    The axes are permuted column by column straight into the bytearray that becomes the message
+    data, the only copy of the points.
+    """
+    num_points = lidar_data.shape[0]
+    data = bytearray(16 * num_points)
+    cloud = numpy.frombuffer(data, dtype='<f4').reshape(num_points, 4)
+    for column, axis in enumerate(LIDAR_AXIS_ORDER):
+        cloud[:, column] = lidar_data[:, axis]
+
+    if msg is None:
+        msg = PointCloud2()
+    msg.header = header
+    msg.height = 1
+    msg.width = num_points
+    msg.fields = LIDAR_POINT_FIELDS
+    msg.is_bigendian = False
+    msg.point_step = 16
+    msg.row_step = 16 * num_points
+    msg.is_dense = False
+    msg.data = data
+    return msg
+
+class LidarPreprocessor(object):
+
+    """
+    Reduces the (N, 4) CARLA lidar points, in the sensor frame, before they are published.
+    Each stage is enabled by its key in the lidar sensor spec:
+        crop_range, crop_min_range: bounds of the horizontal distance to the sensor, in metres
+        crop_min_height, crop_max_height: bounds of the height relative to the sensor, in metres
+        remove_ground: drops the points within ground_tolerance metres (0.2 by default) of a plane
+            fitted to the lowest ground_percentile percent of the points (30 by default)
+        voxel_size: replaces the points of each voxel by their centroid, in metres
+    """
+
+    # numeric keys, a stage is enabled once its key is set, 0 included
+    SPEC_KEYS = ('crop_range', 'crop_min_range', 'crop_min_height', 'crop_max_height', 'voxel_size')
+
+    def __init__(self, crop_range=None, crop_min_range=None, crop_min_height=None, crop_max_height=None,
+                 remove_ground=False, ground_tolerance=0.2, ground_percentile=30.0, voxel_size=None):
+        self.crop_range = crop_range
+        self.crop_min_range = crop_min_range
+        self.crop_min_height = crop_min_height
+        self.crop_max_height = crop_max_height
+        self.remove_ground = remove_ground
+        self.ground_tolerance = ground_tolerance
+        self.ground_percentile = ground_percentile
+        self.voxel_size = voxel_size
+
+    @classmethod
+    def from_spec(cls, sensor):
+        """
+        Returns the preprocessor set by the sensor spec, None if it enables no stage
+        """
+        if not sensor.get('remove_ground') and not any(sensor.get(key) is not None for key in cls.SPEC_KEYS):
+            return None
+        return cls(sensor.get('crop_range'), sensor.get('crop_min_range'), sensor.get('crop_min_height'),
+                   sensor.get('crop_max_height'), bool(sensor.get('remove_ground')),
+                   float(sensor.get('ground_tolerance', 0.2)), float(sensor.get('ground_percentile', 30.0)),
+                   sensor.get('voxel_size'))
+
+    def crop(self, points):
+        mask = numpy.ones(points.shape[0], dtype=bool)
+        if self.crop_range is not None or self.crop_min_range is not None:
+            squared_range = points[:, 0] * points[:, 0] + points[:, 1] * points[:, 1]
+            if self.crop_range is not None:
+                mask &= squared_range <= self.crop_range * self.crop_range
+            if self.crop_min_range is not None:
+                mask &= squared_range >= self.crop_min_range * self.crop_min_range
+        if self.crop_min_height is not None:
+            mask &= points[:, 2] >= self.crop_min_height
+        if self.crop_max_height is not None:
+            mask &= points[:, 2] <= self.crop_max_height
+        return points[mask]
+
+    def drop_ground(self, points):
+        """
+        Fits z = a * x + b * y + c by least squares to the lowest points and drops the points close to it
+        """
+        if points.shape[0] < 3:
+            return points
+        heights = points[:, 2]
+        candidates = points[heights <= numpy.percentile(heights, self.ground_percentile)]
+        if candidates.shape[0] < 3:
+            return points
+
+        design = numpy.column_stack((candidates[:, 0], candidates[:, 1], numpy.ones(candidates.shape[0])))
+        plane = numpy.linalg.lstsq(design, candidates[:, 2], rcond=None)[0]
+        ground_heights = points[:, 0] * plane[0] + points[:, 1] * plane[1] + plane[2]
+        return points[heights - ground_heights > self.ground_tolerance]
+
+    def voxel_downsample(self, points):
+        """
+        Replaces the points of each voxel by their centroid, intensity included
+        """
+        if points.shape[0] == 0:
+            return points
+        voxels = numpy.floor(points[:, :3] / self.voxel_size).astype(numpy.int64)
+        voxels -= voxels.min(axis=0)
+        dimensions = voxels.max(axis=0) + 1
+        keys = (voxels[:, 0] * dimensions[1] + voxels[:, 1]) * dimensions[2] + voxels[:, 2]
+        _, inverse, counts = numpy.unique(keys, return_inverse=True, return_counts=True)
+
+        centroids = numpy.empty((counts.shape[0], 4), dtype=numpy.float32)
+        for column in range(4):
+            centroids[:, column] = numpy.bincount(inverse, weights=points[:, column]) / counts
+        return centroids
+
+    def __call__(self, points):
+        points = self.crop(points)
+        if self.remove_ground:
+            points = self.drop_ground(points)
+        if self.voxel_size:
+            points = self.voxel_downsample(points)
+        return points
+
+CAMERA_ENCODINGS = ('bgra8', 'bgr8', 'rgb8', 'mono8')
+
+def image_pixels(image, encoding='bgra8', mono_buffer=None):
+    """
+    Returns the pixels of the (height, width, 4) BGRA CARLA image in the given encoding.
+
+    The channels are dropped or swapped by a strided view, without copy. mono8 is converted by OpenCV,
+    into mono_buffer if given.
+    """
+    if encoding == 'bgra8':
+        return image
+    elif encoding == 'bgr8':
+        return image[:, :, :3]
+    elif encoding == 'rgb8':
+        return image[:, :, 2::-1]
+    elif encoding == 'mono8':
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY, dst=mono_buffer)
+    raise ValueError("Invalid camera encoding: {}".format(encoding))
+
+def image_to_msg(header, image, encoding='bgra8', mono_buffer=None, msg=None):
+    """
+    Converts the (height, width, 4) BGRA CARLA image to an Image message (msg if given) with the given encoding.
+    The message data is taken from the pixels in a single copy.
+    """
+    pixels = image_pixels(image, encoding, mono_buffer)
+
+    if msg is None:
+        msg = Image()
+    msg.header = header
+    msg.height = image.shape[0]
+    msg.width = image.shape[1]
+    msg.encoding = encoding
+    msg.is_bigendian = False
+    msg.data = pixels.tobytes()
+    msg.step = len(msg.data) // msg.height
+    return msg
+
+# cv2.imencode extension and parameter of each compression, with its default value
+CAMERA_COMPRESSIONS = {'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 80),
+                       'png': ('.png', cv2.IMWRITE_PNG_COMPRESSION, 3)}
+
+def image_to_compressed_msg(header, image, compression='jpeg', quality=None, bgr_buffer=None, msg=None):
+    """
+    Encodes the (height, width, 4) BGRA CARLA image to a CompressedImage message (msg if given), in the format
+    image_transport expects. quality is the JPEG quality (0-100) or the PNG compression level (0-9).
+    """
+    extension, parameter, default_quality = CAMERA_COMPRESSIONS[compression]
+    if quality is None:
+        quality = default_quality
+
+    bgr_image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR, dst=bgr_buffer)
+    success, encoded = cv2.imencode(extension, bgr_image, [parameter, int(quality)])
+    if not success:
+        raise RuntimeError("Could not encode the image to {}".format(compression))
+
+    if msg is None:
+        msg = CompressedImage()
+    msg.header = header
+    msg.format = 'bgr8; {} compressed bgr8'.format(compression)
+    msg.data = encoded.tobytes()
+    return msg
+
+def plan_to_path(plan):
+    """
+    Converts a global plan, a list of (carla.Transform, RoadOption), to a Path message in the ROS
+    (right handed) convention. The orientations are computed in a single vectorized pass over the yaws.
+    """
+    poses = numpy.array([(transform.location.x, transform.location.y, transform.location.z,
+                          transform.rotation.yaw) for transform, _ in plan], dtype=numpy.float64).reshape(-1, 4)
+
+    # quaternion of a rotation of -yaw around z, as quaternion_from_euler(0, 0, -yaw) computes it
+    half_yaws = -numpy.radians(poses[:, 3]) / 2.0
+    columns = zip(poses[:, 0].tolist(), (-poses[:, 1]).tolist(), poses[:, 2].tolist(),
+                  numpy.sin(half_yaws).tolist(), numpy.cos(half_yaws).tolist())
+
+    msg = Path()
+    msg.header.frame_id = "map"
+    for x, y, z, orientation_z, orientation_w in columns:
+        pose = PoseStamped()
+        position = pose.pose.position
+        position.x = x
+        position.y = y
+        position.z = z
+        orientation = pose.pose.orientation
+        orientation.z = orientation_z
+        orientation.w = orientation_w
+        msg.poses.append(pose)
+    return msg
+
+class RouteCursor(object):
+
+    """
+    Progress of the ego vehicle along a global plan, in metres from its start.
+
+    The cursor only moves forward, and the nearest segment is searched among the SEARCH_SEGMENTS
+    following the cursor, so an update costs the same whatever the length of the route.
+    """
+
+    SEARCH_SEGMENTS = 10
+
+    def __init__(self, plan):
+        self._points = numpy.array([(transform.location.x, transform.location.y) for transform, _ in plan],
+                                   dtype=numpy.float64).reshape(-1, 2)
+        self._segments = numpy.diff(self._points, axis=0)
+        self._lengths = numpy.hypot(self._segments[:, 0], self._segments[:, 1])
+        self._distances = numpy.concatenate(([0.0], numpy.cumsum(self._lengths)))
+        self.index = 0
+        self.progress = 0.0
+
+    def update(self, x, y):
+        """
+        Moves the cursor to the projection of (x, y) on the nearest segment ahead, returns the progress
+        """
+        end = min(self.index + self.SEARCH_SEGMENTS, len(self._lengths))
+        if end <= self.index:
+            return self.progress
+
+        starts = self._points[self.index:end]
+        segments = self._segments[self.index:end]
+        lengths = self._lengths[self.index:end]
+        ratios = ((x - starts[:, 0]) * segments[:, 0] + (y - starts[:, 1]) * segments[:, 1]) / \
+            numpy.maximum(lengths * lengths, 1e-6)
+        ratios = numpy.clip(ratios, 0.0, 1.0)
+        distances = numpy.hypot(starts[:, 0] + ratios * segments[:, 0] - x, starts[:, 1] + ratios * segments[:, 1] - y)
+
+        nearest = int(numpy.argmin(distances))
+        progress = self._distances[self.index + nearest] + ratios[nearest] * lengths[nearest]
+        if progress > self.progress:
+            self.index += nearest
+            self.progress = float(progress)
+        return self.progress
+
+    def get_window(self, horizon):
+        """
+        Returns the [start, end) indexes of the plan points from the cursor up to horizon metres ahead,
+        including the first point past it
+        """
+        end = int(numpy.searchsorted(self._distances, self.progress + horizon, side='right')) + 1
+        return self.index, min(end, len(self._points))
+
+class PublishingStage(object):
+
+    """
+    Runs the publication of the sensor messages on a pool of worker threads, so that run_step
+    can return the control without waiting for their conversion and serialization.
+
+    The jobs of a topic run one at a time and in the order they were submitted. When a topic falls
+    behind, its oldest pending jobs are dropped (and counted) so that at most max_pending wait, per
+    sensor publishing on the topic (see set_sensor_count).
+    """
+
+    def __init__(self, num_workers, max_pending=2):
+        self._max_pending = max_pending
+        self._lane_sizes = {}
+        self._lanes = {}
+        self._scheduled = set()
+        self._dropped = {}
+        self._ready = Queue()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+        self._workers = []
+        for _ in range(num_workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def set_sensor_count(self, topic, count):
+        """
+        Sets the number of sensors publishing on the topic, each of them submitting a job per frame
+        """
+        with self._lock:
+            self._lane_sizes[topic] = self._max_pending * count
+
+    def submit(self, topic, job, done=None):
+        """
+        Queues job on the lane of the topic. done(published) is called once the job ran (True) or
+        was dropped (False), so that it can give back the buffers the job was reading.
+        """
+        with self._lock:
+            lane = self._lanes.setdefault(topic, deque())
+            lane.append((job, done))
+            while len(lane) > self._lane_sizes.get(topic, self._max_pending):
+                _, dropped_done = lane.popleft()
+                self._dropped[topic] = self._dropped.get(topic, 0) + 1
+                if dropped_done is not None:
+                    dropped_done(False)
+
+            if topic not in self._scheduled:
+                self._scheduled.add(topic)
+                self._ready.put(topic)
+
+    def get_dropped(self):
+        with self._lock:
+            return dict(self._dropped)
+
+    def _work(self):
+        while True:
+            topic = self._ready.get()
+            if topic is None:
+                return
+
+            with self._lock:
+                job, done = self._lanes[topic].popleft()
+
+            try:
+                job()
+            except Exception as e:  # pylint: disable=broad-except
+                rospy.logerr("Publishing on {} failed: {}".format(topic, e))
+            finally:
+                if done is not None:
+                    done(True)
+
+            with self._lock:
+                if self._lanes[topic]:
+                    self._ready.put(topic)
+                else:
+                    self._scheduled.discard(topic)
+                    self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Waits until every submitted job ran, returns False on timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._idle:
+            while self._scheduled:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        self.flush(timeout)
+        for _ in self._workers:
+            self._ready.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+
+class FramePublication(object):
+
+    """
+    Tracks the publish jobs of the sensors of a frame, for the lockstep mode to wait until the stack
+    got all of them before waiting for its control
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = 0
+        self.dropped = False
+
+    def add(self):
+        with self._condition:
+            self._pending += 1
+
+    def done(self, published):
+        with self._condition:
+            self._pending -= 1
+            if not published:
+                self.dropped = True
+            self._condition.notify_all()
+
+    def wait(self, timeout):
+        """
+        Waits until every job of the frame ran or was dropped, returns False on timeout
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._pending > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+
 class RosAgent(AutonomousAgent):
 
     """
@@ -53,13 +474,21 @@ class RosAgent(AutonomousAgent):
     stack_process = None    
     current_map_name = None
     step_mode_possible = None
+    # default bound of the points of a lidar frame written to shared memory
+    SHM_MAX_LIDAR_POINTS = 200000
+    # a control matches a step when their stamps differ by less than this, in seconds
+    CONTROL_STAMP_TOLERANCE = 1e-6
     vehicle_info_publisher = None
     global_plan_published_time = None
+    global_plan_msg = None
+    global_plan_window_msg = None
+    route_cursor = None
     start_script = None
     manual_data_debug = False
     counter = 0
     open_drive_map_data = None
     open_drive_map_name = None
+    open_drive_map_hash = None
 
     def setup(self, path_to_conf_file):
         """
@@ -74,6 +503,7 @@ class RosAgent(AutonomousAgent):
         self.counter = 0
         self.open_drive_map_name = None
         self.open_drive_map_data = None       
+        self.open_drive_map_hash = None
                 
         # get start_script from environment
         team_code_path = os.environ['TEAM_CODE_ROOT']
@@ -95,19 +525,36 @@ class RosAgent(AutonomousAgent):
 
         # publish first clock value '0'
         self.clock_publisher = rospy.Publisher('clock', Clock, queue_size=10, latch=True)
-        self.clock_publisher.publish(Clock(rospy.Time.from_sec(0)))
+        self.clock_msg = Clock()
+        self.clock_publisher.publish(self.clock_msg)
         
         self.timestamp = None
         self.speed = 0
         #publish global path every 2 seconds
         self.global_plan_published_time = 0 
+        # or, with a horizon (in metres), only the upcoming part of it each time the ego moved
+        # OP_BRIDGE_PLAN_REPUBLISH_DISTANCE metres along it
+        self.plan_horizon = float(os.environ.get('OP_BRIDGE_PLAN_HORIZON', 0))
+        self.plan_republish_distance = float(os.environ.get('OP_BRIDGE_PLAN_REPUBLISH_DISTANCE', 20))
+        self.plan_published_progress = None
         
-        self.vehicle_status_publisher = None        
-        self.vehicle_imu_publisher = None              
-        self.map_file_publisher = None
         self.current_map_name = None        
         self.step_mode_possible = False
 
+        # lockstep: run_step waits up to OP_BRIDGE_LOCKSTEP_TIMEOUT seconds for the sensor data of its frame
+        # to be published, then as long for the control of the frame
+        self.lockstep = os.environ.get('OP_BRIDGE_LOCKSTEP', '').lower() in ('1', 'true')
+        self.lockstep_timeout = float(os.environ.get('OP_BRIDGE_LOCKSTEP_TIMEOUT', 1.0))
+        self.control_condition = threading.Condition()
+        self.current_control_stamp = None
+        # stamps of the last frames run_step gave up waiting for
+        self.timed_out_control_stamps = deque(maxlen=16)
+        self.frame_publication = None
+        self.lockstep_timeouts = 0
+        self.lockstep_late_controls = 0
+        # frames whose sensor data didn't all reach the stack, their control isn't waited for
+        self.lockstep_skipped_frames = 0
+
         self.vehicle_control_subscriber = rospy.Subscriber(
             '/carla_op_controller_cmd', TwistStamped, self.on_vehicle_control)
 
@@ -116,35 +563,131 @@ class RosAgent(AutonomousAgent):
         self.waypoint_publisher = rospy.Publisher(
             self.topic_waypoints, Path, queue_size=1, latch=True)
 
+        publish_workers = os.environ.get('OP_BRIDGE_PUBLISH_WORKERS')
+        self.setup_sensor_publishers(int(publish_workers) if publish_workers else None)
+
+    def create_publisher(self, topic, msg_type):  # pylint: disable=no-self-use
+        """
+        Returns the publisher of a sensor topic. It isn't latched: rospy would serialize the latched
+        message again for each new subscriber, while the reused message is filled with the next frame.
+        """
+        return rospy.Publisher(topic, msg_type, queue_size=1)
+
+    def create_shm_writer(self, sensor_id, slot_size, slot_count):
+        """
+        Returns the shared memory ring of a sensor, /dev/shm/op_bridge_<role>_<sensor id>
+        """
+        path = '/dev/shm/op_bridge_{}_{}'.format(self.agent_role_name, sensor_id)
+        return ShmRingWriter(path, slot_size, slot_count)
+
+    def setup_sensor_publishers(self, publish_workers=None):
+        """
+        Creates the publishers of the sensors and the messages they reuse at every step.
+
+        The sensors are published from a pool of publish_workers threads, one per sensor by default,
+        and on the tick thread if it is 0.
+        """
+        self.vehicle_status_publisher = None        
+        self.vehicle_imu_publisher = None              
+        self.map_file_publisher = None
         self.publisher_map = {}
+        self.lidar_buffer_map = {}
         self.id_to_sensor_type_map = {}
         self.id_to_camera_info_map = {}
-        self.cv_bridge = CvBridge()
+        self.id_to_camera_encoding_map = {}
+        self.mono_buffer_map = {}
+        self.id_to_camera_compression_map = {}
+        self.bgr_buffer_map = {}
+        self.msg_template_map = {}
+        self.lidar_preprocessor_map = {}
+        self.lidar_point_counts = {}
+        self.shm_writer_map = {}
+        self.skipped_frames = {}
+        # with OP_BRIDGE_SHM_TRANSPORT, the camera and lidar payloads are written to a /dev/shm ring of
+        # OP_BRIDGE_SHM_SLOTS slots, and only a std_msgs/Header announcing them is published on <topic>/shm
+        shm_transport = os.environ.get('OP_BRIDGE_SHM_TRANSPORT', '').lower() in ('1', 'true')
+        shm_slots = int(os.environ.get('OP_BRIDGE_SHM_SLOTS', 4))
+        # the camera and lidar frames are only converted for topics with subscribers, unless
+        # OP_BRIDGE_LAZY_PUBLISHING is 0
+        self.lazy_publishing = os.environ.get('OP_BRIDGE_LAZY_PUBLISHING', '1').lower() not in ('0', 'false')
+        self.publishing_stage = None
+        self.compression_stage = None
 
         # setup ros publishers for sensors
         # pylint: disable=line-too-long
         for sensor in self.sensors():
             self.id_to_sensor_type_map[sensor['id']] = sensor['type']
             if sensor['type'] == 'sensor.camera.rgb':
-                self.publisher_map[sensor['id']] = rospy.Publisher(
-                    self.topic_base + '/camera/rgb/' + sensor['id'] + "/image_color", Image, queue_size=1, latch=True)
+                if shm_transport:
+                    self.shm_writer_map[sensor['id']] = self.create_shm_writer(
+                        sensor['id'], int(sensor['width']) * int(sensor['height']) * 4, shm_slots)
+                    self.publisher_map[sensor['id']] = self.create_publisher(
+                        self.topic_base + '/camera/rgb/' + sensor['id'] + "/image_color/shm", Header)
+                else:
+                    self.publisher_map[sensor['id']] = self.create_publisher(
+                        self.topic_base + '/camera/rgb/' + sensor['id'] + "/image_color", Image)
                 self.id_to_camera_info_map[sensor['id']] = self.build_camera_info(sensor)
-                self.publisher_map[sensor['id'] + '_info'] = rospy.Publisher(
-                    self.topic_base + '/camera/rgb/' + sensor['id'] + "/camera_info", CameraInfo, queue_size=1, latch=True)
+                self.msg_template_map[sensor['id']] = Image(header=Header(frame_id='camera'))
+                # optional 'encoding' of the published image, bgra8 as sent by CARLA by default
+                encoding = sensor.get('encoding', 'bgra8')
+                if encoding not in CAMERA_ENCODINGS:
+                    raise ValueError("Invalid camera encoding: {}".format(encoding))
+                self.id_to_camera_encoding_map[sensor['id']] = encoding
+                if encoding == 'mono8':
+                    self.mono_buffer_map[sensor['id']] = numpy.empty(
+                        (int(sensor['height']), int(sensor['width'])), dtype=numpy.uint8)
+                # optional 'compression' (jpeg or png) and 'compression_quality', published on image_color/compressed
+                if sensor.get('compression'):
+                    if sensor['compression'] not in CAMERA_COMPRESSIONS:
+                        raise ValueError("Invalid camera compression: {}".format(sensor['compression']))
+                    self.id_to_camera_compression_map[sensor['id']] = (sensor['compression'],
+                                                                       sensor.get('compression_quality'))
+                    self.msg_template_map[sensor['id'] + '_compressed'] = CompressedImage(header=Header(frame_id='camera'))
+                    self.bgr_buffer_map[sensor['id']] = numpy.empty(
+                        (int(sensor['height']), int(sensor['width']), 3), dtype=numpy.uint8)
+                    self.publisher_map[sensor['id'] + '_compressed'] = self.create_publisher(
+                        self.topic_base + '/camera/rgb/' + sensor['id'] + "/image_color/compressed", CompressedImage)
+                self.publisher_map[sensor['id'] + '_info'] = self.create_publisher(
+                    self.topic_base + '/camera/rgb/' + sensor['id'] + "/camera_info", CameraInfo)
             elif sensor['type'] == 'sensor.lidar.ray_cast':
-                self.publisher_map[sensor['id']] = rospy.Publisher(
-                    self.topic_base + '/lidar/' + sensor['id'] + "/point_cloud", PointCloud2, queue_size=1, latch=True)
+                if shm_transport:
+                    # 'shm_max_points' bounds the points of a frame written to the ring
+                    self.shm_writer_map[sensor['id']] = self.create_shm_writer(
+                        sensor['id'], int(sensor.get('shm_max_points', self.SHM_MAX_LIDAR_POINTS)) * 16, shm_slots)
+                    self.publisher_map[sensor['id']] = self.create_publisher(
+                        self.topic_base + '/lidar/' + sensor['id'] + "/point_cloud/shm", Header)
+                else:
+                    self.publisher_map[sensor['id']] = self.create_publisher(
+                        self.topic_base + '/lidar/' + sensor['id'] + "/point_cloud", PointCloud2)
+                self.msg_template_map[sensor['id']] = PointCloud2(
+                    header=Header(frame_id='velodyne'), height=1, fields=LIDAR_POINT_FIELDS, is_bigendian=False,
+                    point_step=16, is_dense=False)
+                # optional preprocessing of the published cloud, see LidarPreprocessor. With 'publish_raw',
+                # the cloud received from CARLA is published on point_cloud_raw as well
+                preprocessor = LidarPreprocessor.from_spec(sensor)
+                if preprocessor is not None:
+                    self.lidar_preprocessor_map[sensor['id']] = preprocessor
+                    self.lidar_point_counts[sensor['id']] = [0, 0, 0]
+                    if sensor.get('publish_raw'):
+                        self.publisher_map[sensor['id'] + '_raw'] = self.create_publisher(
+                            self.topic_base + '/lidar/' + sensor['id'] + "/point_cloud_raw", PointCloud2)
+                        self.msg_template_map[sensor['id'] + '_raw'] = PointCloud2(
+                            header=Header(frame_id='velodyne'), height=1, fields=LIDAR_POINT_FIELDS,
+                            is_bigendian=False, point_step=16, is_dense=False)
             elif sensor['type'] == 'sensor.other.gnss':
-                self.publisher_map[sensor['id']] = rospy.Publisher(
-                    self.topic_base + '/gnss/' + sensor['id'] + "/fix", NavSatFix, queue_size=1, latch=True)
+                self.publisher_map[sensor['id']] = self.create_publisher(
+                    self.topic_base + '/gnss/' + sensor['id'] + "/fix", NavSatFix)
+                self.msg_template_map[sensor['id']] = self.build_gnss_template()
             elif sensor['type'] == 'sensor.speedometer':                
                 if not self.vehicle_status_publisher:
-                    self.vehicle_status_publisher = rospy.Publisher(
-                        self.topic_base + '/odometry', Odometry, queue_size=1, latch=True)
+                    self.vehicle_status_publisher = self.create_publisher(
+                        self.topic_base + '/odometry', Odometry)
+                self.msg_template_map[sensor['id']] = self.build_odometry_template()
             elif sensor['type'] == 'sensor.other.imu':                
                 if not self.vehicle_imu_publisher:
-                    self.vehicle_imu_publisher = rospy.Publisher(
-                        self.topic_base + '/imu', Imu, queue_size=1, latch=True)
+                    self.vehicle_imu_publisher = self.create_publisher(
+                        self.topic_base + '/imu', Imu)
+                self.msg_template_map[sensor['id']] = Imu(header=Header())
             elif sensor['type'] == 'sensor.opendrive_map':                                
                 if not self.map_file_publisher:
                     self.map_file_publisher = rospy.Publisher('/carla/map_file', String, queue_size=1, latch=True)                
@@ -152,6 +695,20 @@ class RosAgent(AutonomousAgent):
                 raise TypeError("Invalid sensor type: {}".format(sensor['type']))                       
         # pylint: enable=line-too-long
 
+        if publish_workers is None:
+            publish_workers = len(self.id_to_sensor_type_map)
+        if publish_workers > 0:
+            self.publishing_stage = PublishingStage(publish_workers)
+            # the speedometers share the odometry topic, the IMUs the imu one
+            for publisher, sensor_type in ((self.vehicle_status_publisher, 'sensor.speedometer'),
+                                           (self.vehicle_imu_publisher, 'sensor.other.imu')):
+                if publisher:
+                    self.publishing_stage.set_sensor_count(
+                        publisher.name, list(self.id_to_sensor_type_map.values()).count(sensor_type))
+        # the compressed cameras are always encoded off the tick thread
+        if self.id_to_camera_compression_map:
+            self.compression_stage = PublishingStage(len(self.id_to_camera_compression_map))
+
     def init_local_agent(self, role_name, map_name, waypoints_topic_name, enable_explore):
         rospy.loginfo("Executing stack...")
         print("Executing stack...", role_name, map_name)
@@ -159,17 +716,37 @@ class RosAgent(AutonomousAgent):
         self.stack_process = subprocess.Popen(local_start_script, shell=True, preexec_fn=os.setpgrp)
         # self.vehicle_control_event = threading.Event()
 
-    def write_opendrive_map_file(self, map_name, map_data):
-
+    def write_opendrive_map_file(self, map_name, map_data, map_hash=None):
+        """
+        Writes the map to $TEAM_CODE_ROOT/hdmaps/<map_name>.xodr, unless the file already holds the same map
+        """
         team_code_path = os.environ['TEAM_CODE_ROOT']
         if not team_code_path or not os.path.exists(team_code_path):
             raise IOError("Path '{}' defined by TEAM_CODE_ROOT invalid".format(team_code_path))
-        opendrive_map_path = "{}/hdmaps/{}.xodr".format(team_code_path, map_name)        
-
-        f = open(opendrive_map_path, "w")
-        f.write(map_data)
-        f.close()
-        
+        opendrive_map_dir = "{}/hdmaps".format(team_code_path)
+        opendrive_map_path = "{}/{}.xodr".format(opendrive_map_dir, map_name)        
+
+        if map_hash is None:
+            map_hash = opendrive_digest(map_data)
+
+        if os.path.exists(opendrive_map_path):
+            with open(opendrive_map_path, "rb") as f:
+                if opendrive_digest(f.read()) == map_hash:
+                    return
+
+        if not isinstance(map_data, bytes):
+            map_data = map_data.encode('utf-8')
+
+        # write next to the target and rename, so the stack never reads a partially written map
+        fd, tmp_path = tempfile.mkstemp(prefix=".{}.".format(map_name), suffix=".xodr", dir=opendrive_map_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(map_data)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, opendrive_map_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
 
     def on_vehicle_control(self, data):
         """
@@ -188,11 +765,33 @@ class RosAgent(AutonomousAgent):
 
         #cmd.gear = 1
         #cmd.manual_gear_shift = data.manual_gear_shift
-        self.current_control = cmd
-        # if not self.vehicle_control_event.is_set():
-        #     self.vehicle_control_event.set()
-        # After the first vehicle control is sent out, it is possible to use the stepping mode
-        self.step_mode_possible = True
+        stamp = data.header.stamp.to_sec()
+        with self.control_condition:
+            self.current_control = cmd
+            self.current_control_stamp = stamp
+            if any(abs(stamp - timed_out) <= self.CONTROL_STAMP_TOLERANCE for timed_out in self.timed_out_control_stamps):
+                # computed for a frame run_step already gave up on
+                self.lockstep_late_controls += 1
+            # After the first vehicle control is sent out, it is possible to use the stepping mode
+            self.step_mode_possible = True
+            self.control_condition.notify_all()
+
+    def wait_for_control(self, timestamp):
+        """
+        Waits, up to lockstep_timeout, for the control stamped with the timestamp of the step.
+        Returns False on timeout, the latest control received being used then.
+        """
+        deadline = time.time() + self.lockstep_timeout
+        with self.control_condition:
+            while self.current_control_stamp is None or \
+                    self.current_control_stamp < timestamp - self.CONTROL_STAMP_TOLERANCE:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.lockstep_timeouts += 1
+                    self.timed_out_control_stamps.append(timestamp)
+                    return False
+                self.control_condition.wait(remaining)
+        return True
 
     def build_camera_info(self, attributes):  # pylint: disable=no-self-use
         """
@@ -201,8 +800,8 @@ class RosAgent(AutonomousAgent):
         camera info doesn't change over time
         """
         camera_info = CameraInfo()
-        # store info without header
-        camera_info.header = None
+        # only the stamp of the header changes over time
+        camera_info.header = Header(frame_id='camera')
         camera_info.width = int(attributes['width'])
         camera_info.height = int(attributes['height'])
         camera_info.distortion_model = 'plumb_bob'
@@ -217,25 +816,30 @@ class RosAgent(AutonomousAgent):
         camera_info.P = [fx, 0, cx, 0, 0, fy, cy, 0, 0, 0, 1.0, 0]
         return camera_info
 
+    def set_global_plan(self, global_plan_gps, global_plan_world_coord):
+        """
+        Set the plan (route) for the agent, and build the Path message published for it
+        """
+        super(RosAgent, self).set_global_plan(global_plan_gps, global_plan_world_coord)
+        self.global_plan_msg = plan_to_path(self._global_plan_world_coord)
+        if self.plan_horizon > 0:
+            self.global_plan_window_msg = Path()
+            self.global_plan_window_msg.header.frame_id = "map"
+            self.route_cursor = RouteCursor(self._global_plan_world_coord)
+            self.plan_published_progress = None
+
     def publish_plan(self):
         """
-        publish the global plan
+        publish the global plan, only its stamp changes between two publications.
+        With a horizon, only the part of the plan within it is published.
         """
-        msg = Path()
-        msg.header.frame_id = "map"
+        msg = self.global_plan_msg
+        if self.route_cursor is not None:
+            start, end = self.route_cursor.get_window(self.plan_horizon)
+            self.global_plan_window_msg.poses = msg.poses[start:end]
+            self.plan_published_progress = self.route_cursor.progress
+            msg = self.global_plan_window_msg
         msg.header.stamp = rospy.Time.now()
-        for wp in self._global_plan_world_coord:
-            pose = PoseStamped()
-            pose.pose.position.x = wp[0].location.x
-            pose.pose.position.y = -wp[0].location.y
-            pose.pose.position.z = wp[0].location.z
-            quaternion = tf.transformations.quaternion_from_euler(
-               0, 0, -math.radians(wp[0].rotation.yaw))
-            pose.pose.orientation.x = quaternion[0]
-            pose.pose.orientation.y = quaternion[1]
-            pose.pose.orientation.z = quaternion[2]
-            pose.pose.orientation.w = quaternion[3]
-            msg.poses.append(pose)
 
         #rospy.loginfo("Publishing Plan...")
         self.waypoint_publisher.publish(msg)
@@ -253,77 +857,150 @@ class RosAgent(AutonomousAgent):
             ]
         return sensors
 
-    def get_header(self):
+    def build_gnss_template(self):  # pylint: disable=no-self-use
+        """
+        Returns the NavSatFix reused by a gnss, with its constant fields filled
+        """
+        msg = NavSatFix(header=Header(frame_id='gps'))
+        msg.status.status = NavSatStatus.STATUS_SBAS_FIX
+        # pylint: disable=line-too-long
+        msg.status.service = NavSatStatus.SERVICE_GPS | NavSatStatus.SERVICE_GLONASS | NavSatStatus.SERVICE_COMPASS | NavSatStatus.SERVICE_GALILEO
+        # pylint: enable=line-too-long
+        return msg
+
+    def build_odometry_template(self):  # pylint: disable=no-self-use
         """
-        Returns ROS message header
+        Returns the Odometry reused by the speedometer, with its constant fields filled
         """
-        header = Header()
-        header.stamp = rospy.Time.from_sec(self.timestamp)
-        return header
+        msg = Odometry(header=Header())
+        msg.twist.twist.linear.z = 1 # to tell OpenPlanner to use the steer directly
+        msg.twist.twist.angular.x = 1 # to tell OpenPlanner to use the steer directly 
+        return msg
 
-    def publish_lidar(self, sensor_id, data):
+    def publish_lidar(self, sensor_id, data, timestamp=None, publish_cloud=True, publish_raw=False, frame=0):
         """
-        Function to publish lidar data
+        Function to publish lidar data, preprocessed if its spec says so. publish_raw also publishes
+        the cloud as received on the raw topic of a preprocessed lidar.
         """
-        header = self.get_header()
-        header.frame_id = 'velodyne'
         lidar_data = numpy.frombuffer(data, dtype=numpy.float32)
 
         if lidar_data.shape[0] % 4 == 0:
             lidar_data = numpy.reshape(lidar_data, (int(lidar_data.shape[0] / 4), 4))
-            # we take the oposite of y axis
-            # (as lidar point are express in left handed coordinate system, and ros need right handed)
-            # we need a copy here, because the data are read only in carla numpy
-            # array
-            lidar_data = lidar_data
-            # we also need to permute x and y
-            lidar_data = lidar_data[..., [1, 0, 2, 3]]
-            fields = [PointField('x', 0, PointField.FLOAT32, 1),
-                      PointField('y', 4, PointField.FLOAT32, 1),
-                      PointField('z', 8, PointField.FLOAT32, 1),
-                      PointField('intensity', 12, PointField.FLOAT32, 1)]
 
-            msg = create_cloud(header,fields, lidar_data)
-            self.publisher_map[sensor_id].publish(msg)
+            if timestamp is None:
+                timestamp = self.timestamp
+            if publish_raw:
+                msg = self.msg_template_map[sensor_id + '_raw']
+                set_stamp(msg.header, timestamp)
+                lidar_to_point_cloud(msg.header, lidar_data, msg)
+                self.publisher_map[sensor_id + '_raw'].publish(msg)
+
+            if publish_cloud:
+                preprocessor = self.lidar_preprocessor_map.get(sensor_id)
+                if preprocessor is not None:
+                    point_counts = self.lidar_point_counts[sensor_id]
+                    point_counts[0] += 1
+                    point_counts[1] += lidar_data.shape[0]
+                    lidar_data = preprocessor(lidar_data)
+                    point_counts[2] += lidar_data.shape[0]
+
+                msg = self.msg_template_map[sensor_id]
+                set_stamp(msg.header, timestamp)
+                if sensor_id in self.shm_writer_map:
+                    # reuse the cloud buffer of this lidar, growing it when a frame has more points
+                    cloud_buffer = self.lidar_buffer_map.get(sensor_id)
+                    if cloud_buffer is None or cloud_buffer.shape[0] < lidar_data.shape[0]:
+                        cloud_buffer = numpy.empty((lidar_data.shape[0], 4), dtype='<f4')
+                        self.lidar_buffer_map[sensor_id] = cloud_buffer
+                    cloud = cloud_buffer[:lidar_data.shape[0]]
+                    numpy.take(lidar_data, LIDAR_AXIS_ORDER, axis=1, out=cloud, mode='clip')
+                    self.publish_shm(sensor_id, frame, msg.header.stamp, KIND_POINT_CLOUD, cloud.shape[0], 1, 16,
+                                     'xyzi32', cloud)
+                    return
+
+                lidar_to_point_cloud(msg.header, lidar_data, msg)
+                self.publisher_map[sensor_id].publish(msg)
         else:
             print('Cannot Reshape LIDAR Data buffer')
 
-    def publish_gnss(self, sensor_id, data):
+    def publish_shm(self, sensor_id, frame, stamp, kind, width, height, step, encoding, payload):
+        """
+        Writes the payload to the shared memory ring of the sensor and announces it,
+        see leaderboard.envs.shm_transport for the protocol
+        """
+        writer = self.shm_writer_map[sensor_id]
+        sequence = writer.write(frame, (stamp.secs, stamp.nsecs), kind, width, height, step, encoding, payload)
+        if sequence is None:
+            rospy.logwarn("Frame {} of {} doesn't fit in its shared memory slots".format(frame, sensor_id))
+            return
+
+        notification = self.msg_template_map.get(sensor_id + '_shm')
+        if notification is None:
+            notification = Header(frame_id=writer.path)
+            self.msg_template_map[sensor_id + '_shm'] = notification
+        notification.seq = sequence
+        notification.stamp.secs = stamp.secs
+        notification.stamp.nsecs = stamp.nsecs
+        self.publisher_map[sensor_id].publish(notification)
+
+    def get_lidar_point_counts(self):
+        """
+        Returns, for each preprocessed lidar, its number of frames and of points before and after preprocessing
+        """
+        return dict((sensor_id, {'frames': counts[0], 'points_in': counts[1], 'points_out': counts[2]})
+                    for sensor_id, counts in self.lidar_point_counts.items())
+
+    def publish_gnss(self, sensor_id, data, timestamp=None):
         """
         Function to publish gnss data
         """
-        msg = NavSatFix()
-        msg.header = self.get_header()
-        msg.header.frame_id = 'gps'
+        msg = self.msg_template_map[sensor_id]
+        set_stamp(msg.header, self.timestamp if timestamp is None else timestamp)
         msg.latitude = data[0]
         msg.longitude = data[1]
         msg.altitude = data[2]
-        msg.status.status = NavSatStatus.STATUS_SBAS_FIX
-        # pylint: disable=line-too-long
-        msg.status.service = NavSatStatus.SERVICE_GPS | NavSatStatus.SERVICE_GLONASS | NavSatStatus.SERVICE_COMPASS | NavSatStatus.SERVICE_GALILEO
-        # pylint: enable=line-too-long
         self.publisher_map[sensor_id].publish(msg)
 
-    def publish_camera(self, sensor_id, data):
+    def publish_camera(self, sensor_id, data, timestamp=None, publish_image=True, frame=0):
         """
-        Function to publish camera data
+        Function to publish camera data, only its camera info unless publish_image
         """
-        msg = self.cv_bridge.cv2_to_imgmsg(data, encoding='bgra8')
-        # the camera data is in respect to the camera's own frame
-        msg.header = self.get_header()
-        msg.header.frame_id = 'camera'
-
         cam_info = self.id_to_camera_info_map[sensor_id]
-        cam_info.header = msg.header
+        set_stamp(cam_info.header, self.timestamp if timestamp is None else timestamp)
         self.publisher_map[sensor_id + '_info'].publish(cam_info)
+        if not publish_image:
+            return
+
+        # the camera data is in respect to the camera's own frame
+        msg = self.msg_template_map[sensor_id]
+        set_stamp(msg.header, self.timestamp if timestamp is None else timestamp)
+        if sensor_id in self.shm_writer_map:
+            encoding = self.id_to_camera_encoding_map[sensor_id]
+            pixels = image_pixels(data, encoding, self.mono_buffer_map.get(sensor_id))
+            self.publish_shm(sensor_id, frame, msg.header.stamp, KIND_IMAGE, data.shape[1], data.shape[0],
+                             pixels.nbytes // data.shape[0], encoding, pixels)
+            return
+
+        image_to_msg(msg.header, data, self.id_to_camera_encoding_map[sensor_id],
+                     self.mono_buffer_map.get(sensor_id), msg)
         self.publisher_map[sensor_id].publish(msg)
 
-    def publish_imu(self, sensor_id, data):
+    def publish_compressed_camera(self, sensor_id, data, timestamp=None):
+        """
+        Function to publish the compressed camera data
+        """
+        msg = self.msg_template_map[sensor_id + '_compressed']
+        set_stamp(msg.header, self.timestamp if timestamp is None else timestamp)
+        compression, quality = self.id_to_camera_compression_map[sensor_id]
+        image_to_compressed_msg(msg.header, data, compression, quality, self.bgr_buffer_map[sensor_id], msg)
+        self.publisher_map[sensor_id + '_compressed'].publish(msg)
+
+    def publish_imu(self, sensor_id, data, timestamp=None):
         """
         Publish IMU data 
         """
-        imu_msg = Imu()
-        imu_msg.header = self.get_header()
+        imu_msg = self.msg_template_map[sensor_id]
+        set_stamp(imu_msg.header, self.timestamp if timestamp is None else timestamp)
 
         # Carla uses a left-handed coordinate convention (X forward, Y right, Z up).
         # Here, these measurements are converted to the right-handed ROS convention
@@ -336,58 +1013,141 @@ class RosAgent(AutonomousAgent):
         imu_msg.angular_velocity.y = data[4]
         imu_msg.angular_velocity.z = -data[5]
         
-        imu_rotation = data[6]
-
-        quaternion = tf.transformations.quaternion_from_euler(
-               0, 0, -math.radians(imu_rotation))
-        imu_msg.orientation.x = quaternion[0]
-        imu_msg.orientation.y = quaternion[1]
-        imu_msg.orientation.z = quaternion[2]
-        imu_msg.orientation.w = quaternion[3]
+        # quaternion of a rotation around z only, as quaternion_from_euler(0, 0, -yaw) computes it
+        half_yaw = -math.radians(data[6]) / 2.0
+        imu_msg.orientation.x = 0.0
+        imu_msg.orientation.y = 0.0
+        imu_msg.orientation.z = math.sin(half_yaw)
+        imu_msg.orientation.w = math.cos(half_yaw)
         
         self.vehicle_imu_publisher.publish(imu_msg)
 
-    def publish_can(self, sensor_id, data):
+    def publish_can(self, sensor_id, data, timestamp=None, steer=None):
         """
         publish can data
         """    
+        if steer is None:
+            steer = self.current_control.steer
 
-        twist_msg = TwistWithCovariance()        
-        twist_msg.twist.linear.x = data['speed']        
-        if twist_msg.twist.linear.x < 0:
-            twist_msg.twist.linear.x = 0
-        twist_msg.twist.angular.z = -self.current_control.steer
-        twist_msg.twist.linear.z = 1 # to tell OpenPlanner to use the steer directly
-        twist_msg.twist.angular.x = 1 # to tell OpenPlanner to use the steer directly 
+        odo_msg = self.msg_template_map[sensor_id]
+        set_stamp(odo_msg.header, self.timestamp if timestamp is None else timestamp)
+        twist = odo_msg.twist.twist
+        twist.linear.x = max(data['speed'], 0)
+        twist.angular.z = -steer
 
         #print('Current Status : ', msg.twist.linear.x, ', Steer: ', msg.twist.angular.z)
-        odo_msg = Odometry()
-        odo_msg.header = self.get_header()
-        odo_msg.twist = twist_msg
         self.vehicle_status_publisher.publish(odo_msg)
 
     def publish_hd_map(self, sensor_id, data, map_name):
         """
-        publish hd map data
+        publish hd map data, only once per map as the topic is latched
         """                 
         if self.current_map_name != map_name:
             self.current_map_name = map_name        
-        if self.map_file_publisher:            
-            self.map_file_publisher.publish(data['opendrive'])
+        if self.open_drive_map_hash != data['hash']:
+            self.open_drive_map_hash = data['hash']
+            if self.map_file_publisher:
+                self.map_file_publisher.publish(data['opendrive'])
+
+    def publish_sensor(self, publisher, sensor_id, frame, publish, *args, **kwargs):
+        """
+        Publishes a sensor with publish(sensor_id, *args), on the given stage (the publishing stage by
+        default) if there is one. The job is queued on the lane of the topic of the publisher, as several
+        sensors may share a topic (odometry, imu). The data of the frame stays pinned in the sensor
+        interface until it is published.
+        """
+        stage = kwargs.get('stage', self.publishing_stage)
+        if stage is None:
+            publish(sensor_id, *args)
+            return
+
+        self.sensor_interface.pin_data(sensor_id, frame)
+        frame_publication = self.frame_publication
+        if frame_publication is not None:
+            frame_publication.add()
+
+        def job():
+            publish(sensor_id, *args)
+
+        def done(published):
+            self.sensor_interface.unpin_data(sensor_id, frame)
+            if frame_publication is not None:
+                frame_publication.done(published)
+
+        stage.submit(publisher.name, job, done)
+
+    def has_subscribers(self, publisher_id):
+        """
+        Returns whether anything listens to the publisher, counting a skipped frame otherwise.
+        Always True when lazy publishing is disabled.
+        """
+        if not self.lazy_publishing or self.publisher_map[publisher_id].get_num_connections() > 0:
+            return True
+        self.skipped_frames[publisher_id] = self.skipped_frames.get(publisher_id, 0) + 1
+        return False
+
+    def get_skipped_frames(self):
+        """
+        Returns the number of frames not converted for lack of subscribers, by publisher
+        """
+        return dict(self.skipped_frames)
+
+    def publish_sensors(self, input_data, timestamp):
+        """
+        Publishes the data of all sensors, stamped with the timestamp of the step.
+        The camera and lidar frames are not even converted when their topics have no subscribers.
+        """
+        self.frame_publication = FramePublication() if self.use_stepping_mode() else None
+        for key, val in input_data.items():
+            sensor_type = self.id_to_sensor_type_map[key]            
+            if self.manual_data_debug:
+                print(key)
+
+            if sensor_type == 'sensor.camera.rgb':
+                # the camera info goes with the image, it is only skipped when neither is published
+                publish_image = self.has_subscribers(key)
+                if publish_image or self.has_subscribers(key + '_info'):
+                    self.publish_sensor(self.publisher_map[key], key, val[0], self.publish_camera, val[1], timestamp,
+                                        publish_image, val[0])
+                if key in self.id_to_camera_compression_map and self.has_subscribers(key + '_compressed'):
+                    self.publish_sensor(self.publisher_map[key + '_compressed'], key, val[0],
+                                        self.publish_compressed_camera, val[1], timestamp, stage=self.compression_stage)
+            elif sensor_type == 'sensor.opendrive_map':      
+                # extract map name                            
+                self.open_drive_map_data = val[1]['opendrive']
+                self.open_drive_map_name = self._get_map_name(val[1]['map_name'])
+                self.publish_hd_map(key, val[1], self.open_drive_map_name) #Extract dictionary with map data and transform and odometry                   
+            elif sensor_type == 'sensor.other.gnss':
+                self.publish_sensor(self.publisher_map[key], key, val[0], self.publish_gnss, val[1], timestamp)
+            elif sensor_type == 'sensor.lidar.ray_cast':
+                publish_cloud = self.has_subscribers(key)
+                publish_raw = key + '_raw' in self.publisher_map and self.has_subscribers(key + '_raw')
+                if publish_cloud or publish_raw:
+                    self.publish_sensor(self.publisher_map[key], key, val[0], self.publish_lidar, val[1], timestamp,
+                                        publish_cloud, publish_raw, val[0])
+            elif sensor_type == 'sensor.speedometer':
+                self.publish_sensor(self.vehicle_status_publisher, key, val[0], self.publish_can, val[1], timestamp,
+                                    self.current_control.steer)
+            elif sensor_type == 'sensor.other.imu':                
+                self.publish_sensor(self.vehicle_imu_publisher, key, val[0], self.publish_imu, val[1], timestamp)
+            elif self.manual_data_debug:
+                print('Additional Sensor !! ') 
+                print(key)
 
     def use_stepping_mode(self):  # pylint: disable=no-self-use
         """
         Overload this function to use stepping mode!
+        Enabled by OP_BRIDGE_LOCKSTEP, run_step then returns the control computed by the stack for its frame.
         """
-        return False
+        return self.lockstep
 
     def run_step(self, input_data, timestamp):
         """
         Execute one step of navigation.
         """        
-        town_map_name = self._get_map_name(CarlaDataProvider.get_map().name)
+        town_map_name = self._get_town_map_name()
         if self.stack_process is None and town_map_name is not None and self.open_drive_map_data is not None:
-            self.write_opendrive_map_file(self.open_drive_map_name, self.open_drive_map_data)
+            self.write_opendrive_map_file(self.open_drive_map_name, self.open_drive_map_data, self.open_drive_map_hash)
             if self.bridge_mode == 'free' or self.bridge_mode == 'srunner':
                 self.init_local_agent(self.agent_role_name, town_map_name, '', 'true')
             elif self.bridge_mode == 'leaderboard':
@@ -403,7 +1163,8 @@ class RosAgent(AutonomousAgent):
         
         # self.vehicle_control_event.clear()
         self.timestamp = timestamp
-        self.clock_publisher.publish(Clock(rospy.Time.from_sec(timestamp)))
+        set_stamp(self.clock_msg, timestamp, 'clock')
+        self.clock_publisher.publish(self.clock_msg)
 
 
         # check if stack is still running
@@ -411,35 +1172,28 @@ class RosAgent(AutonomousAgent):
             raise RuntimeError("Stack exited with: {} {}".format(
                 self.stack_process.returncode, self.stack_process.communicate()[0]))
         
+        if self.route_cursor is not None:
+            # republish the window once the ego moved far enough along the route
+            ego_state = EgoStateProvider.get_hero_state()
+            if ego_state is not None:
+                self.route_cursor.update(ego_state.transform.location.x, ego_state.transform.location.y)
+            if self.plan_published_progress is not None and \
+                    self.route_cursor.progress - self.plan_published_progress >= self.plan_republish_distance:
+                self.publish_plan()
         #wait 2 second before publish the global path  
-        if self._global_plan_world_coord and (self.timestamp - self.global_plan_published_time) > 2.0:
+        elif self._global_plan_world_coord and (self.timestamp - self.global_plan_published_time) > 2.0:
             self.global_plan_published_time = self.timestamp      
             self.publish_plan()
 
         # publish data of all sensors
-        for key, val in input_data.items():
-            sensor_type = self.id_to_sensor_type_map[key]            
-            if self.manual_data_debug:
-                print(key)
+        self.publish_sensors(input_data, timestamp)
 
-            if sensor_type == 'sensor.camera.rgb':
-                self.publish_camera(key, val[1])
-            elif sensor_type == 'sensor.opendrive_map':      
-                # extract map name                            
-                self.open_drive_map_data = val[1]['opendrive']
-                self.open_drive_map_name = self._get_map_name(CarlaDataProvider.get_map().name)
-                self.publish_hd_map(key, val[1], self.open_drive_map_name) #Extract dictionary with map data and transform and odometry                   
-            elif sensor_type == 'sensor.other.gnss':
-                self.publish_gnss(key, val[1])
-            elif sensor_type == 'sensor.lidar.ray_cast':
-                self.publish_lidar(key, val[1])
-            elif sensor_type == 'sensor.speedometer':
-                self.publish_can(key, val[1])
-            elif sensor_type == 'sensor.other.imu':                
-                self.publish_imu(key, val[1])
-            elif self.manual_data_debug:
-                print('Additional Sensor !! ') 
-                print(key)
+        # once the stack answers, wait for the control matching this frame, after its sensor data was published
+        if self.use_stepping_mode() and self.step_mode_possible:
+            if self.frame_publication.wait(self.lockstep_timeout) and not self.frame_publication.dropped:
+                self.wait_for_control(timestamp)
+            else:
+                self.lockstep_skipped_frames += 1
 
         # count_out = 500
         # # if self.open_drive_map_name == 'Town01' or self.open_drive_map_name == 'Town03':
@@ -467,6 +1221,24 @@ class RosAgent(AutonomousAgent):
             rospy.loginfo("Terminated stack.")
 
         rospy.loginfo("Stack is no longer running")        
+        if self.use_stepping_mode():
+            rospy.loginfo("Lockstep: {} timeouts, {} late controls, {} frames without all their sensor data".format(
+                self.lockstep_timeouts, self.lockstep_late_controls, self.lockstep_skipped_frames))
+        if self.skipped_frames:
+            rospy.loginfo("Frames skipped without subscribers: {}".format(self.skipped_frames))
+        for sensor_id, counts in self.get_lidar_point_counts().items():
+            if counts['frames']:
+                rospy.loginfo("Lidar {}: {:.0f} points per frame before preprocessing, {:.0f} after".format(
+                    sensor_id, counts['points_in'] / float(counts['frames']), counts['points_out'] / float(counts['frames'])))
+        if self.publishing_stage:
+            self.publishing_stage.stop(timeout=1.0)
+            self.publishing_stage = None
+        if self.compression_stage:
+            self.compression_stage.stop(timeout=1.0)
+            self.compression_stage = None
+        for writer in self.shm_writer_map.values():
+            writer.close()
+        self.shm_writer_map = {}
         if self.map_file_publisher:
             self.map_file_publisher.unregister()
         if self.vehicle_status_publisher:
@@ -481,6 +1253,15 @@ class RosAgent(AutonomousAgent):
         #raise TypeError("Just Stop ................. Please ")
         rospy.loginfo("Cleanup finished")
 
+    def _get_town_map_name(self):
+        """
+        Name of the map of the world, or of the OpenDRIVE reading when there is no world (sensor replay)
+        """
+        try:
+            return self._get_map_name(CarlaDataProvider.get_map().name)
+        except ValueError:
+            return self.open_drive_map_name
+
     def _get_map_name(self, map_full_name):
 
         if map_full_name is None:
@@ -0,0 +1,630 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Micro-benchmarks of the ROS side of the bridge (message conversion done by op_ros_agent).
+No simulator nor roscore is needed, but the CARLA and ROS python APIs must be importable.
+"""
+
+from __future__ import print_function
+
+import argparse
+from argparse import RawTextHelpFormatter
+from io import BytesIO
+import multiprocessing
+import os
+import socket
+import struct
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'op_bridge'))
+
+import carla
+import tf
+from cv_bridge import CvBridge
+from geometry_msgs.msg import PoseStamped, TwistWithCovariance
+from nav_msgs.msg import Odometry, Path
+import rospy
+from sensor_msgs.msg import Image, Imu, NavSatFix, NavSatStatus
+from sensor_msgs.point_cloud2 import create_cloud
+from std_msgs.msg import Header
+
+from leaderboard.envs.sensor_interface import SensorInterface
+from leaderboard.envs.shm_transport import KIND_IMAGE, ShmRingReader, ShmRingWriter
+from leaderboard.utils.latency_histogram import LatencyHistogram
+import op_ros_agent
+
+
+def synthetic_lidar(num_points):
+    points = np.random.uniform(-100.0, 100.0, (num_points, 4)).astype(np.float32)
+    points[:, 3] = np.random.uniform(0.0, 1.0, num_points)
+    return points
+
+
+def benchmark_lidar(args):
+    points = synthetic_lidar(args.points)
+    header = Header()
+
+    start = time.time()
+    for _ in range(args.iterations):
+        legacy_msg = create_cloud(header, op_ros_agent.LIDAR_POINT_FIELDS, points[..., [1, 0, 2, 3]])
+    legacy_time = (time.time() - start) / args.iterations
+
+    start = time.time()
+    for _ in range(args.iterations):
+        msg = op_ros_agent.lidar_to_point_cloud(header, points)
+    vectorized_time = (time.time() - start) / args.iterations
+
+    if msg.data != legacy_msg.data:
+        print('[Error] The vectorized cloud differs from the create_cloud one')
+        return -1
+
+    print('LiDAR frame of {} points'.format(args.points))
+    print('  create_cloud : {:14.0f} points/s'.format(args.points / legacy_time))
+    print('  vectorized   : {:14.0f} points/s'.format(args.points / vectorized_time))
+    return 0
+
+
+def benchmark_camera(args):
+    image = np.random.randint(0, 256, (args.height, args.width, 4), dtype=np.uint8)
+    header = Header()
+    cv_bridge = CvBridge()
+
+    start = time.time()
+    for _ in range(args.iterations):
+        legacy_msg = cv_bridge.cv2_to_imgmsg(image, encoding='bgra8')
+    legacy_time = (time.time() - start) / args.iterations
+
+    msg = op_ros_agent.image_to_msg(header, image, 'bgra8')
+    for field in ('height', 'width', 'encoding', 'is_bigendian', 'step', 'data'):
+        if getattr(msg, field) != getattr(legacy_msg, field):
+            print('[Error] The {} of the direct bgra8 image differs from the cv_bridge one'.format(field))
+            return -1
+
+    print('Camera {}x{} BGRA'.format(args.width, args.height))
+    print('  {:18s}: {:8.1f} frames/s, {:10d} bytes per frame'.format(
+        'cv_bridge bgra8', 1.0 / legacy_time, len(legacy_msg.data)))
+
+    mono_buffer = np.empty((args.height, args.width), dtype=np.uint8)
+    for encoding in op_ros_agent.CAMERA_ENCODINGS:
+        start = time.time()
+        for _ in range(args.iterations):
+            msg = op_ros_agent.image_to_msg(header, image, encoding, mono_buffer)
+        direct_time = (time.time() - start) / args.iterations
+        print('  {:18s}: {:8.1f} frames/s, {:10d} bytes per frame'.format(
+            'direct ' + encoding, 1.0 / direct_time, len(msg.data)))
+    return 0
+
+
+def synthetic_camera(width, height):
+    """
+    Returns a BGRA image with smooth gradients and some noise, closer to a rendered frame than pure noise
+    """
+    rows = np.linspace(0, 255, height, dtype=np.float32)[:, np.newaxis]
+    columns = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :]
+    image = np.empty((height, width, 4), dtype=np.uint8)
+    image[:, :, 0] = columns
+    image[:, :, 1] = rows
+    image[:, :, 2] = (rows + columns) / 2
+    image[:, :, :3] += np.random.randint(0, 8, (height, width, 3), dtype=np.uint8)
+    image[:, :, 3] = 255
+    return image
+
+
+def benchmark_compressed(args):
+    image = synthetic_camera(args.width, args.height)
+    header = Header()
+    bgr_buffer = np.empty((args.height, args.width, 3), dtype=np.uint8)
+
+    print('Camera {}x{} BGRA, bandwidth at {} Hz'.format(args.width, args.height, args.rate))
+
+    start = time.time()
+    for _ in range(args.iterations):
+        msg = op_ros_agent.image_to_msg(header, image, 'bgra8')
+        msg.serialize(BytesIO())
+    raw_time = (time.time() - start) / args.iterations
+    print('  {:18s}: {:8.1f} frames/s, {:8.2f} MB/s'.format(
+        'raw bgra8', 1.0 / raw_time, len(msg.data) * args.rate / 1e6))
+
+    for compression in sorted(op_ros_agent.CAMERA_COMPRESSIONS):
+        quality = args.jpeg_quality if compression == 'jpeg' else args.png_compression
+        start = time.time()
+        for _ in range(args.iterations):
+            msg = op_ros_agent.image_to_compressed_msg(header, image, compression, quality, bgr_buffer)
+            msg.serialize(BytesIO())
+        encode_time = (time.time() - start) / args.iterations
+        print('  {:18s}: {:8.1f} frames/s, {:8.2f} MB/s'.format(
+            '{} ({})'.format(compression, quality), 1.0 / encode_time, len(msg.data) * args.rate / 1e6))
+    return 0
+
+
+def densified_route(routes_file, route_id, spacing):
+    """
+    Returns the plan of the route with the given id (the one with the most waypoints if None) of a
+    routes file, its waypoints linearly interpolated every spacing metres as a stand-in for the
+    route planner.
+    """
+    routes = ET.parse(routes_file).getroot().findall('route')
+    if route_id is None:
+        route = max(routes, key=lambda route: len(route.findall('waypoint')))
+    else:
+        route = [route for route in routes if route.attrib['id'] == route_id][0]
+
+    keypoints = np.array([(float(waypoint.attrib['x']), float(waypoint.attrib['y']), float(waypoint.attrib['z']))
+                          for waypoint in route.findall('waypoint')])
+    plan = []
+    for start, end in zip(keypoints[:-1], keypoints[1:]):
+        length = np.linalg.norm(end - start)
+        yaw = np.degrees(np.arctan2(end[1] - start[1], end[0] - start[0]))
+        for ratio in np.arange(0.0, 1.0, spacing / max(length, spacing)):
+            x, y, z = (start + ratio * (end - start)).tolist()
+            plan.append((carla.Transform(carla.Location(x=x, y=y, z=z), carla.Rotation(yaw=float(yaw))), None))
+    return route.attrib['id'], plan
+
+
+def legacy_plan_to_path(plan):
+    """
+    Builds the Path message as RosAgent.publish_plan did before it was cached
+    """
+    msg = Path()
+    msg.header.frame_id = "map"
+    for wp in plan:
+        pose = PoseStamped()
+        pose.pose.position.x = wp[0].location.x
+        pose.pose.position.y = -wp[0].location.y
+        pose.pose.position.z = wp[0].location.z
+        quaternion = tf.transformations.quaternion_from_euler(0, 0, -np.radians(wp[0].rotation.yaw))
+        pose.pose.orientation.x = quaternion[0]
+        pose.pose.orientation.y = quaternion[1]
+        pose.pose.orientation.z = quaternion[2]
+        pose.pose.orientation.w = quaternion[3]
+        msg.poses.append(pose)
+    return msg
+
+
+def benchmark_plan(args):
+    route_id, plan = densified_route(args.routes, args.route_id, args.spacing)
+
+    start = time.time()
+    for _ in range(args.iterations):
+        legacy_msg = legacy_plan_to_path(plan)
+        legacy_msg.serialize(BytesIO())
+    legacy_time = (time.time() - start) / args.iterations
+
+    start = time.time()
+    msg = op_ros_agent.plan_to_path(plan)
+    build_time = time.time() - start
+
+    start = time.time()
+    for _ in range(args.iterations):
+        msg.header.stamp = rospy.Time.from_sec(start)
+        msg.serialize(BytesIO())
+    cached_time = (time.time() - start) / args.iterations
+
+    legacy_msg.header.stamp = msg.header.stamp
+    legacy_buffer = BytesIO()
+    legacy_msg.serialize(legacy_buffer)
+    buffer = BytesIO()
+    msg.serialize(buffer)
+    if not np.allclose(np.frombuffer(buffer.getvalue()[-7 * 8:], dtype='<f8'),
+                       np.frombuffer(legacy_buffer.getvalue()[-7 * 8:], dtype='<f8')):
+        print('[Error] The cached plan differs from the legacy one')
+        return -1
+
+    print('Route {} of {}, {} waypoints every {} m'.format(route_id, args.routes, len(plan), args.spacing))
+    print('  legacy publish : {:10.3f} ms'.format(legacy_time * 1000.0))
+    print('  cached build   : {:10.3f} ms, once per route'.format(build_time * 1000.0))
+    print('  cached publish : {:10.3f} ms'.format(cached_time * 1000.0))
+    return 0
+
+
+def receive_exactly(connection, size):
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def loopback_receiver(port, transport, segment_path):
+    """
+    Stands for the stack: receives length prefixed messages as TCPROS frames them, deserializes them,
+    gets the image (from the segment for the shm transport) and acknowledges it with one byte
+    """
+    connection = socket.create_connection(('127.0.0.1', port))
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    reader = ShmRingReader(segment_path) if transport == 'shm' else None
+    while True:
+        size = receive_exactly(connection, 4)
+        if size is None:
+            break
+        data = receive_exactly(connection, struct.unpack('<I', size)[0])
+        if transport == 'tcp':
+            msg = Image()
+            msg.deserialize(data)
+            pixels = np.frombuffer(msg.data, dtype=np.uint8)
+        else:
+            notification = Header()
+            notification.deserialize(data)
+            _, payload = reader.read(notification.seq)
+            pixels = np.frombuffer(payload, dtype=np.uint8)
+        connection.sendall(b'k' if pixels.size else b'e')
+
+    if reader is not None:
+        reader.close()
+    connection.close()
+
+
+def measure_loopback(transport, image, args):
+    """
+    Returns the histogram of the time from the conversion of a frame to its acknowledgement by the receiver
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    writer = None
+    segment_path = '/dev/shm/op_bridge_benchmark_{}'.format(os.getpid())
+    if transport == 'shm':
+        writer = ShmRingWriter(segment_path, image.nbytes, args.slots)
+
+    receiver = multiprocessing.Process(target=loopback_receiver,
+                                       args=(server.getsockname()[1], transport, segment_path))
+    receiver.start()
+    connection, _ = server.accept()
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    header = Header()
+    histogram = LatencyHistogram()
+    for frame in range(args.frames):
+        start = time.time()
+        op_ros_agent.set_stamp(header, frame * 0.05)
+        if transport == 'tcp':
+            msg = op_ros_agent.image_to_msg(header, image, args.encoding)
+        else:
+            pixels = op_ros_agent.image_pixels(image, args.encoding)
+            msg = Header(seq=writer.write(frame, (header.stamp.secs, header.stamp.nsecs), KIND_IMAGE,
+                                          image.shape[1], image.shape[0], pixels.nbytes // image.shape[0],
+                                          args.encoding, pixels),
+                         stamp=header.stamp, frame_id=segment_path)
+        buffer = BytesIO()
+        msg.serialize(buffer)
+        data = buffer.getvalue()
+        connection.sendall(struct.pack('<I', len(data)) + data)
+        if receive_exactly(connection, 1) != b'k':
+            print('[Error] The receiver did not get frame {}'.format(frame))
+            break
+        histogram.add(time.time() - start)
+
+    connection.close()
+    receiver.join()
+    server.close()
+    if writer is not None:
+        writer.close()
+    return histogram
+
+
+def benchmark_shm(args):
+    image = synthetic_camera(args.width, args.height)
+
+    print('Camera {}x{} {} sent to another process over loopback, {} frames'.format(
+        args.width, args.height, args.encoding, args.frames))
+    for transport in ('tcp', 'shm'):
+        summary = measure_loopback(transport, image, args).summary()
+        print('  {}: p50 {} ms, p95 {} ms, p99 {} ms, max {} ms'.format(
+            transport, summary['p50'], summary['p95'], summary['p99'], summary['max']))
+    return 0
+
+
+class SerializingPublisher(object):
+    """
+    Stands for a rospy.Publisher with one subscriber, it only serializes the messages
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def publish(self, msg):
+        msg.serialize(BytesIO())
+
+    def get_num_connections(self):
+        return 1
+
+
+class OfflineRosAgent(op_ros_agent.RosAgent):
+    """
+    RosAgent with the sensors of the given types, whose publishers only serialize the messages.
+    No roscore nor stack is started.
+    """
+
+    def __init__(self, publish_workers, sensor_types=None):  # pylint: disable=super-init-not-called
+        self._sensor_types = sensor_types
+        self.sensor_interface = SensorInterface()
+        self.agent_role_name = 'hero'
+        self.topic_base = '/carla/hero'
+        self.timestamp = 0.0
+        self.current_control = carla.VehicleControl()
+        self.lockstep = False
+        self.setup_sensor_publishers(publish_workers)
+
+    def sensors(self):
+        sensors = super(OfflineRosAgent, self).sensors()
+        if self._sensor_types is not None:
+            sensors = [sensor for sensor in sensors if sensor['type'] in self._sensor_types]
+        return sensors
+
+    def create_publisher(self, topic, msg_type):
+        return SerializingPublisher(topic)
+
+
+def offline_agent(publish_workers, sensor_types=None):
+    return OfflineRosAgent(publish_workers, sensor_types)
+
+
+def synthetic_scene(num_points, sensor_height=2.4):
+    """
+    Returns lidar points in the sensor frame: a ground plane under the sensor, two thirds of them,
+    and boxes standing on it
+    """
+    num_ground = num_points * 2 // 3
+    ranges = np.random.uniform(2.0, 100.0, num_points)
+    angles = np.random.uniform(-np.pi, np.pi, num_points)
+    points = np.empty((num_points, 4), dtype=np.float32)
+    points[:, 0] = ranges * np.cos(angles)
+    points[:, 1] = ranges * np.sin(angles)
+    points[:num_ground, 2] = -sensor_height + np.random.normal(0.0, 0.02, num_ground)
+    points[num_ground:, 2] = -sensor_height + np.random.uniform(0.3, 4.0, num_points - num_ground)
+    points[:, 3] = np.random.uniform(0.0, 1.0, num_points)
+    return points
+
+
+def benchmark_lidar_preprocessing(args):
+    points = synthetic_scene(args.points)
+    preprocessor = op_ros_agent.LidarPreprocessor(
+        crop_range=args.crop_range, crop_min_range=args.crop_min_range, crop_min_height=args.crop_min_height,
+        crop_max_height=args.crop_max_height, remove_ground=not args.keep_ground, voxel_size=args.voxel_size)
+
+    start = time.time()
+    for _ in range(args.iterations):
+        reduced = preprocessor(points)
+    preprocess_time = (time.time() - start) / args.iterations
+
+    header = Header()
+    raw_size = len(op_ros_agent.lidar_to_point_cloud(header, points).data)
+    reduced_size = len(op_ros_agent.lidar_to_point_cloud(header, reduced).data)
+
+    print('Synthetic LiDAR frame of {} points, range {} m, voxel {} m, ground {}'.format(
+        args.points, args.crop_range, args.voxel_size, 'kept' if args.keep_ground else 'removed'))
+    print('  points  : {:10d} -> {:10d}'.format(points.shape[0], reduced.shape[0]))
+    print('  message : {:10d} -> {:10d} bytes ({:.1f}x smaller)'.format(
+        raw_size, reduced_size, raw_size / float(max(reduced_size, 1))))
+    print('  preprocessing: {:.3f} ms per frame'.format(preprocess_time * 1000.0))
+    return 0
+
+
+def synthetic_input_data(agent, frame, lidar_points):
+    input_data = {}
+    for sensor in agent.sensors():
+        if sensor['type'] == 'sensor.camera.rgb':
+            data = np.zeros((sensor['height'], sensor['width'], 4), dtype=np.uint8)
+        elif sensor['type'] == 'sensor.lidar.ray_cast':
+            data = synthetic_lidar(lidar_points)
+        elif sensor['type'] == 'sensor.other.gnss':
+            data = np.array([48.99, 8.0, 0.0])
+        elif sensor['type'] == 'sensor.other.imu':
+            data = np.zeros(7)
+        elif sensor['type'] == 'sensor.speedometer':
+            data = {'speed': 5.0}
+        else:
+            continue
+        input_data[sensor['id']] = (frame, data)
+    return input_data
+
+
+def measure_publish_ticks(publish_workers, args):
+    """
+    Returns the histogram of the time run_step spends publishing the sensors, and the drops of the stage
+    """
+    agent = offline_agent(publish_workers)
+    input_data = synthetic_input_data(agent, 0, args.points)
+
+    histogram = LatencyHistogram()
+    for frame in range(args.ticks):
+        timestamp = frame * args.tick_period
+        start = time.time()
+        agent.publish_sensors(input_data, timestamp)
+        elapsed = time.time() - start
+        histogram.add(elapsed)
+        # the simulator computes the next frame meanwhile
+        time.sleep(max(0.0, args.tick_period - elapsed))
+
+    dropped = {}
+    if agent.publishing_stage is not None:
+        agent.publishing_stage.stop()
+        dropped = agent.publishing_stage.get_dropped()
+    return histogram, dropped
+
+
+def legacy_publish(agent, input_data, timestamp):
+    """
+    Publishes the gnss, imu and speedometer as RosAgent did before the message templates
+    """
+    for key, val in input_data.items():
+        sensor_type = agent.id_to_sensor_type_map[key]
+        data = val[1]
+        header = Header()
+        header.stamp = rospy.Time.from_sec(timestamp)
+        if sensor_type == 'sensor.other.gnss':
+            msg = NavSatFix()
+            msg.header = header
+            msg.header.frame_id = 'gps'
+            msg.latitude = data[0]
+            msg.longitude = data[1]
+            msg.altitude = data[2]
+            msg.status.status = NavSatStatus.STATUS_SBAS_FIX
+            msg.status.service = NavSatStatus.SERVICE_GPS | NavSatStatus.SERVICE_GLONASS
+            agent.publisher_map[key].publish(msg)
+        elif sensor_type == 'sensor.other.imu':
+            msg = Imu()
+            msg.header = header
+            msg.linear_acceleration.x = data[0]
+            msg.linear_acceleration.y = -data[1]
+            msg.linear_acceleration.z = data[2]
+            msg.angular_velocity.x = -data[3]
+            msg.angular_velocity.y = data[4]
+            msg.angular_velocity.z = -data[5]
+            quaternion = tf.transformations.quaternion_from_euler(0, 0, -np.radians(data[6]))
+            msg.orientation.x = quaternion[0]
+            msg.orientation.y = quaternion[1]
+            msg.orientation.z = quaternion[2]
+            msg.orientation.w = quaternion[3]
+            agent.vehicle_imu_publisher.publish(msg)
+        elif sensor_type == 'sensor.speedometer':
+            twist_msg = TwistWithCovariance()
+            twist_msg.twist.linear.x = max(data['speed'], 0)
+            twist_msg.twist.angular.z = -agent.current_control.steer
+            twist_msg.twist.linear.z = 1
+            twist_msg.twist.angular.x = 1
+            msg = Odometry()
+            msg.header = header
+            msg.twist = twist_msg
+            agent.vehicle_status_publisher.publish(msg)
+
+
+def measure_allocations(publish, ticks):
+    """
+    Returns the average bytes allocated per tick by publish(timestamp), and its average duration
+    without tracing
+    """
+    import tracemalloc
+
+    tracemalloc.start()
+    allocated = []
+    for frame in range(ticks):
+        tick_start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        publish(frame * 0.05)
+
+        _, tick_peak = tracemalloc.get_traced_memory()
+        allocated.append(tick_peak - tick_start)
+    tracemalloc.stop()
+
+    start = time.time()
+    for frame in range(ticks):
+        publish(frame * 0.05)
+    duration = (time.time() - start) / ticks
+
+    # Skip the first ticks, where the caches of the message classes are filled
+    return float(np.mean(allocated[3:])), duration
+
+
+def benchmark_allocations(args):
+    agent = offline_agent(0, ('sensor.other.gnss', 'sensor.other.imu', 'sensor.speedometer'))
+    input_data = synthetic_input_data(agent, 0, 0)
+
+    legacy_bytes, legacy_time = measure_allocations(
+        lambda timestamp: legacy_publish(agent, input_data, timestamp), args.ticks)
+    template_bytes, template_time = measure_allocations(
+        lambda timestamp: agent.publish_sensors(input_data, timestamp), args.ticks)
+
+    print('Publishing the gnss, imu and speedometer, {} ticks'.format(args.ticks))
+    print('  fresh messages : {:8.0f} bytes allocated, {:8.1f} us per tick'.format(legacy_bytes, legacy_time * 1e6))
+    print('  templates      : {:8.0f} bytes allocated, {:8.1f} us per tick'.format(template_bytes, template_time * 1e6))
+    return 0
+
+
+def benchmark_publish(args):
+    inline, _ = measure_publish_ticks(0, args)
+    staged, dropped = measure_publish_ticks(args.workers, args)
+
+    print('Publishing the default sensors ({} LiDAR points), {} ticks of {} s'.format(
+        args.points, args.ticks, args.tick_period))
+    for name, histogram in (('tick thread', inline), ('staged', staged)):
+        summary = histogram.summary()
+        print('  {:12s}: p50 {} ms, p95 {} ms, p99 {} ms, max {} ms per tick'.format(
+            name, summary['p50'], summary['p95'], summary['p99'], summary['max']))
+    print('  dropped by the stage: {}'.format(dropped or 'none'))
+    return 0
+
+
+def main():
+    description = 'Micro-benchmarks of the ROS message conversion done by op_ros_agent.\n'
+    parser = argparse.ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    lidar_parser = subparsers.add_parser('lidar', help='Throughput of the LiDAR to PointCloud2 conversion')
+    lidar_parser.add_argument('--points', type=int, default=60000,
+                              help='Points per frame (default: 1,200,000 points/s at 20 Hz)')
+    lidar_parser.add_argument('--iterations', type=int, default=20)
+    lidar_parser.set_defaults(func=benchmark_lidar)
+
+    preprocessing_parser = subparsers.add_parser('lidar-preprocessing',
+                                                 help='Point reduction and cost of the LiDAR preprocessing')
+    preprocessing_parser.add_argument('--points', type=int, default=60000)
+    preprocessing_parser.add_argument('--crop-range', type=float, default=50.0)
+    preprocessing_parser.add_argument('--crop-min-range', type=float, default=2.5)
+    preprocessing_parser.add_argument('--crop-min-height', type=float, default=None)
+    preprocessing_parser.add_argument('--crop-max-height', type=float, default=2.0)
+    preprocessing_parser.add_argument('--voxel-size', type=float, default=0.2)
+    preprocessing_parser.add_argument('--keep-ground', action='store_true')
+    preprocessing_parser.add_argument('--iterations', type=int, default=20)
+    preprocessing_parser.set_defaults(func=benchmark_lidar_preprocessing)
+
+    camera_parser = subparsers.add_parser('camera', help='Throughput of the camera to Image conversion per encoding')
+    camera_parser.add_argument('--width', type=int, default=1280)
+    camera_parser.add_argument('--height', type=int, default=720)
+    camera_parser.add_argument('--iterations', type=int, default=100)
+    camera_parser.set_defaults(func=benchmark_camera)
+
+    compressed_parser = subparsers.add_parser('compressed', help='Encode throughput of the compressed camera topics')
+    compressed_parser.add_argument('--width', type=int, default=1280)
+    compressed_parser.add_argument('--height', type=int, default=720)
+    compressed_parser.add_argument('--rate', type=float, default=20.0, help='Camera rate in Hz (default: 20)')
+    compressed_parser.add_argument('--jpeg-quality', type=int, default=80)
+    compressed_parser.add_argument('--png-compression', type=int, default=3)
+    compressed_parser.add_argument('--iterations', type=int, default=50)
+    compressed_parser.set_defaults(func=benchmark_compressed)
+
+    plan_parser = subparsers.add_parser('plan', help='Cost of publishing the global plan of a long route')
+    plan_parser.add_argument('--routes', default=os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'routes_training.xml'))
+    plan_parser.add_argument('--route-id', default=None, help='Route to use (default: the longest)')
+    plan_parser.add_argument('--spacing', type=float, default=1.0, help='Distance between waypoints, in metres')
+    plan_parser.add_argument('--iterations', type=int, default=10)
+    plan_parser.set_defaults(func=benchmark_plan)
+
+    allocations_parser = subparsers.add_parser('allocations', help='Allocations per tick of the small sensor messages')
+    allocations_parser.add_argument('--ticks', type=int, default=100)
+    allocations_parser.set_defaults(func=benchmark_allocations)
+
+    shm_parser = subparsers.add_parser('shm', help='Camera latency to another process, TCP against shared memory')
+    shm_parser.add_argument('--width', type=int, default=1280)
+    shm_parser.add_argument('--height', type=int, default=720)
+    shm_parser.add_argument('--encoding', default='bgra8', choices=op_ros_agent.CAMERA_ENCODINGS)
+    shm_parser.add_argument('--frames', type=int, default=200)
+    shm_parser.add_argument('--slots', type=int, default=4)
+    shm_parser.set_defaults(func=benchmark_shm)
+
+    publish_parser = subparsers.add_parser('publish', help='Time run_step spends publishing, with and without the stage')
+    publish_parser.add_argument('--points', type=int, default=60000)
+    publish_parser.add_argument('--ticks', type=int, default=200)
+    publish_parser.add_argument('--tick-period', type=float, default=0.05)
+    publish_parser.add_argument('--workers', type=int, default=6)
+    publish_parser.set_defaults(func=benchmark_publish)
+
+    arguments = parser.parse_args()
+    return arguments.func(arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
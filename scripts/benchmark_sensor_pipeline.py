@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Micro-benchmarks of the bridge sensor pipeline, fed with synthetic CARLA measurements.
+No simulator is needed, but the CARLA and scenario runner python APIs must be importable.
+"""
+
+from __future__ import print_function
+
+import argparse
+from argparse import RawTextHelpFormatter
+import copy
+import sys
+import threading
+import time
+
+import numpy as np
+
+import carla
+from leaderboard.envs.sensor_interface import CallBack, GenericMeasurement, SensorInterface, SensorReceivedNoData
+
+
+class FakeImage(object):
+    """
+    Stands for a carla.Image, the raw buffer is allocated once as the server owns it
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.frame = 0
+        self.raw_data = bytearray(width * height * 4)
+
+
+def legacy_parse_image(image, tag, sensor_interface):
+    array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
+    array = copy.deepcopy(array)
+    array = np.reshape(array, (image.height, image.width, 4))
+    sensor_interface.update_sensor(tag, array, image.frame)
+
+
+def measure_image_ticks(parse, image, ticks):
+    """
+    Returns the average bytes newly allocated per tick, keeping the data of the last frame alive
+    as the agent would
+    """
+    import tracemalloc
+
+    sensor_interface = SensorInterface()
+    callback = CallBack('Center', 'sensor.camera.rgb', None, sensor_interface)
+    if parse is None:
+        def parse(image, _, __):
+            callback(image)
+
+    tracemalloc.start()
+    allocated = []
+    input_data = None
+    for frame in range(1, ticks + 1):
+        image.frame = frame
+        tick_start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        parse(image, 'Center', sensor_interface)
+        input_data = sensor_interface.get_data(frame)
+
+        _, tick_peak = tracemalloc.get_traced_memory()
+        allocated.append(tick_peak - tick_start)
+    tracemalloc.stop()
+
+    del input_data
+    # Skip the first ticks, where the pool is being filled
+    return float(np.mean(allocated[3:]))
+
+
+def benchmark_images(args):
+    image = FakeImage(args.width, args.height)
+
+    legacy = measure_image_ticks(legacy_parse_image, image, args.ticks)
+    pooled = measure_image_ticks(None, image, args.ticks)
+
+    print('Camera {}x{} BGRA, {} ticks'.format(args.width, args.height, args.ticks))
+    print('  deepcopy path : {:12.0f} bytes allocated per tick'.format(legacy))
+    print('  pooled path   : {:12.0f} bytes allocated per tick'.format(pooled))
+
+
+def legacy_dispatch(callback, data, tag, sensor_interface):
+    # pylint: disable=protected-access
+    if isinstance(data, carla.libcarla.Image):
+        parsed_data = callback._parse_image_cb(data, tag)
+    elif isinstance(data, carla.libcarla.LidarMeasurement):
+        parsed_data = callback._parse_lidar_cb(data, tag)
+    elif isinstance(data, carla.libcarla.RadarMeasurement):
+        parsed_data = callback._parse_radar_cb(data, tag)
+    elif isinstance(data, carla.libcarla.GnssMeasurement):
+        parsed_data = callback._parse_gnss_cb(data, tag)
+    elif isinstance(data, carla.libcarla.IMUMeasurement):
+        parsed_data = callback._parse_imu_cb(data, tag)
+    elif isinstance(data, GenericMeasurement):
+        parsed_data = callback._parse_pseudosensor(data, tag)
+    sensor_interface.update_sensor(tag, parsed_data, data.frame)
+
+
+def benchmark_callbacks(args):
+    sensor_interface = SensorInterface()
+    callback = CallBack('speed', 'sensor.speedometer', None, sensor_interface)
+    measurement = GenericMeasurement({'speed': 0.0}, 1)
+
+    start = time.time()
+    for _ in range(args.callbacks):
+        legacy_dispatch(callback, measurement, 'speed', sensor_interface)
+    legacy_time = time.time() - start
+
+    start = time.time()
+    for _ in range(args.callbacks):
+        callback(measurement)
+    table_time = time.time() - start
+
+    print('{} synthetic pseudo-sensor measurements'.format(args.callbacks))
+    print('  isinstance chain : {:12.0f} callbacks/s'.format(args.callbacks / legacy_time))
+    print('  dispatch table   : {:12.0f} callbacks/s'.format(args.callbacks / table_time))
+
+
+def check_overflow(args):
+    """
+    Feeds a camera faster than a slow agent consumes it and checks that the traced memory stays flat
+    """
+    import tracemalloc
+
+    image = FakeImage(args.width, args.height)
+    print('Camera {}x{} produced at {} Hz, consumed at {} Hz during {} s'.format(
+        args.width, args.height, args.producer_rate, args.consumer_rate, args.duration))
+
+    result = 0
+    for policy in SensorInterface.OVERFLOW_POLICIES:
+        sensor_interface = SensorInterface()
+        callback = CallBack('Center', 'sensor.camera.rgb', None, sensor_interface)
+        sensor_interface.set_overflow_policy('Center', args.buffer_size, policy, 1.0 / args.consumer_rate)
+        sensor_interface._queue_timeout = 1.0 / args.consumer_rate  # pylint: disable=protected-access
+
+        running = [True]
+        produced = [0]
+
+        def produce():
+            while running[0]:
+                produced[0] += 1
+                image.frame = produced[0]
+                callback(image)
+                time.sleep(1.0 / args.producer_rate)
+
+        tracemalloc.start()
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+
+        memory = []
+        missed = 0
+        end_time = time.time() + args.duration
+        while time.time() < end_time:
+            time.sleep(1.0 / args.consumer_rate)
+            # the agent always asks for the most recent frame, which may be overwritten before it gets it
+            try:
+                sensor_interface.get_data(produced[0])
+            except SensorReceivedNoData:
+                missed += 1
+            memory.append(tracemalloc.get_traced_memory()[0])
+
+        running[0] = False
+        producer.join()
+        tracemalloc.stop()
+
+        # Compare the memory held in the first and last quarter of the run
+        quarter = max(1, len(memory) // 4)
+        start_memory = max(memory[:quarter])
+        end_memory = max(memory[-quarter:])
+        flat = end_memory <= start_memory * 1.1
+        if not flat:
+            result = -1
+
+        print('  {:12s}: {} produced, {} dropped, {} missed, memory {:.1f} MB -> {:.1f} MB [{}]'.format(
+            policy, produced[0], sensor_interface.get_dropped()['Center'], missed,
+            start_memory / 1e6, end_memory / 1e6, 'flat' if flat else 'GROWING'))
+
+    return result
+
+
+def main():
+    description = 'Micro-benchmarks of the bridge sensor pipeline with synthetic measurements.\n'
+    parser = argparse.ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    images_parser = subparsers.add_parser('images', help='Bytes allocated per tick by the camera callback')
+    images_parser.add_argument('--width', type=int, default=1280)
+    images_parser.add_argument('--height', type=int, default=720)
+    images_parser.add_argument('--ticks', type=int, default=200)
+    images_parser.set_defaults(func=benchmark_images)
+
+    callbacks_parser = subparsers.add_parser('callbacks', help='Callbacks per second of the sensor dispatch')
+    callbacks_parser.add_argument('--callbacks', type=int, default=200000)
+    callbacks_parser.set_defaults(func=benchmark_callbacks)
+
+    overflow_parser = subparsers.add_parser('overflow', help='Memory of the sensor buffers under a slow consumer')
+    overflow_parser.add_argument('--width', type=int, default=1280)
+    overflow_parser.add_argument('--height', type=int, default=720)
+    overflow_parser.add_argument('--producer-rate', type=float, default=100.0)
+    overflow_parser.add_argument('--consumer-rate', type=float, default=5.0)
+    overflow_parser.add_argument('--buffer-size', type=int, default=3)
+    overflow_parser.add_argument('--duration', type=float, default=5.0)
+    overflow_parser.set_defaults(func=check_overflow)
+
+    arguments = parser.parse_args()
+    return arguments.func(arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Benchmarks of the tick loops against a fake synchronous world, no simulator is needed:
+    - cpu: CPU, get_snapshot calls and frames ticked per agent step of the legacy polling tick loop
+      and of the TickDriver
+    - pipeline: frames per second of the TickDriver, in series and pipelined (the world ticking
+      while the agent runs)
+
+The fake world computes a frame in --server-step ms when ticked, and its snapshot reaches the
+client --stream-latency ms later, as the world state comes through a stream separate from the
+tick RPC. Each world.get_snapshot() costs --rpc-cost us of client CPU.
+
+In synchronous mode the polling loop is paced by world.tick() as well, so the CPU per simulated
+second of both loops is about the same, the cost of the get_snapshot calls excepted. The driver
+makes a single get_snapshot call instead of one per frame, and never ticks a frame the agent
+doesn't see: the polling loop also ticks the world on the iterations without a new snapshot, which
+happens once the stream latency is above the server step.
+"""
+
+from __future__ import print_function
+
+import argparse
+from argparse import RawTextHelpFormatter
+from collections import namedtuple
+import resource
+import sys
+import threading
+import time
+
+from leaderboard.envs.tick_driver import TickDriver
+
+
+FakeTimestamp = namedtuple('FakeTimestamp', ['frame', 'elapsed_seconds', 'delta_seconds'])
+FakeSnapshot = namedtuple('FakeSnapshot', ['frame', 'timestamp'])
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class FakeWorld(object):
+
+    """
+    Stands for a synchronous carla.World, see the module documentation
+    """
+
+    def __init__(self, delta_seconds, server_step, stream_latency, rpc_cost):
+        self._delta_seconds = delta_seconds
+        self._server_step = server_step
+        self._stream_latency = stream_latency
+        self._rpc_cost = rpc_cost
+
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._next_callback_id = 0
+        self._frame = 0
+        self._snapshot = self._make_snapshot(0)
+        self.snapshot_calls = 0
+
+    def _make_snapshot(self, frame):
+        return FakeSnapshot(frame, FakeTimestamp(frame, (frame + 1) * self._delta_seconds, self._delta_seconds))
+
+    def _deliver(self, frame):
+        snapshot = self._make_snapshot(frame)
+        with self._lock:
+            self._snapshot = snapshot
+            callbacks = list(self._callbacks.values())
+        for callback in callbacks:
+            callback(snapshot)
+
+    def get_snapshot(self):
+        self.snapshot_calls += 1
+        end = time.time() + self._rpc_cost
+        while time.time() < end:
+            pass
+        with self._lock:
+            return self._snapshot
+
+    def on_tick(self, callback):
+        with self._lock:
+            self._next_callback_id += 1
+            self._callbacks[self._next_callback_id] = callback
+            return self._next_callback_id
+
+    def remove_on_tick(self, callback_id):
+        with self._lock:
+            self._callbacks.pop(callback_id, None)
+
+    def tick(self, timeout=None):
+        self._frame += 1
+        time.sleep(self._server_step)
+        if self._stream_latency > 0:
+            delivery = threading.Timer(self._stream_latency, self._deliver, (self._frame,))
+            delivery.daemon = True
+            delivery.start()
+        else:
+            self._deliver(self._frame)
+        return self._frame
+
+
+class FakeAgentLoop(object):
+
+    """
+    Steps of the agent, stopping after the given simulation time
+    """
+
+    def __init__(self, duration, agent_time):
+        self.duration = duration
+        self.agent_time = agent_time
+        self.running = True
+        self.steps = 0
+        self.timestamp_last_run = 0.0
+
+    def tick(self, snapshot):
+        timestamp = snapshot.timestamp
+        if self.timestamp_last_run < timestamp.elapsed_seconds and self.running:
+            self.timestamp_last_run = timestamp.elapsed_seconds
+            self.steps += 1
+            if self.agent_time > 0:
+                time.sleep(self.agent_time)
+            if timestamp.elapsed_seconds >= self.duration:
+                self.running = False
+        return self.running
+
+
+class FakePipelinedAgentLoop(FakeAgentLoop):
+
+    """
+    Starts the world tick before the agent step, as the pipelined ScenarioManager and bridge do
+    """
+
+    def __init__(self, duration, agent_time, tick_driver):
+        super(FakePipelinedAgentLoop, self).__init__(duration, agent_time)
+        self.tick_driver = tick_driver
+
+    def tick(self, snapshot):
+        if self.timestamp_last_run < snapshot.timestamp.elapsed_seconds and self.running and \
+                snapshot.timestamp.elapsed_seconds < self.duration:
+            self.tick_driver.start_tick()
+        return super(FakePipelinedAgentLoop, self).tick(snapshot)
+
+
+def legacy_loop(world, agent_loop):
+    """
+    The loop of AgentHandler.run_agent and ScenarioManager.run_scenario before the TickDriver,
+    returns its iterations without an agent step
+    """
+    iterations = 0
+    while agent_loop.running:
+        iterations += 1
+        snapshot = world.get_snapshot()
+        if snapshot:
+            agent_loop.tick(snapshot)
+            if agent_loop.running:
+                world.tick()
+    return iterations - agent_loop.steps
+
+
+def driver_loop(world, agent_loop):
+    """
+    The TickDriver, returns its wait timeouts
+    """
+    driver = TickDriver(world)
+    driver.run(agent_loop.tick)
+    return driver.wait_timeouts
+
+
+def make_world(args):
+    return FakeWorld(args.delta_seconds, args.server_step / 1000.0, args.stream_latency / 1000.0,
+                     args.rpc_cost / 1e6)
+
+
+def measure(loop, args):
+    world = make_world(args)
+    agent_loop = FakeAgentLoop(args.duration, args.agent_time / 1000.0)
+
+    start_cpu = cpu_time()
+    start = time.time()
+    idle = loop(world, agent_loop)
+    wall_time = time.time() - start
+    cpu = cpu_time() - start_cpu
+
+    simulated = agent_loop.timestamp_last_run
+    return {'cpu': cpu / simulated, 'wall': wall_time / simulated, 'steps': agent_loop.steps,
+            'frames': world._frame, 'idle': idle, 'snapshots': world.snapshot_calls}  # pylint: disable=protected-access
+
+
+def benchmark_cpu(args):
+    print('{:.0f} simulated seconds at {:.0f} Hz, server step {} ms, stream latency {} ms, agent step {} ms'.format(
+        args.duration, 1.0 / args.delta_seconds, args.server_step, args.stream_latency, args.agent_time))
+    for name, loop in (('polling loop', legacy_loop), ('tick driver', driver_loop)):
+        result = measure(loop, args)
+        print('  {:12s}: {:7.3f} CPU s / simulated s, {:6.3f} wall s / simulated s, {} agent steps for {} frames, '
+              '{} idle iterations, {} get_snapshot calls'.format(
+                  name, result['cpu'], result['wall'], result['steps'], result['frames'], result['idle'],
+                  result['snapshots']))
+    return 0
+
+
+def benchmark_pipeline(args):
+    print('{:.0f} simulated seconds at {:.0f} Hz, server step {} ms, stream latency {} ms, agent step {} ms'.format(
+        args.duration, 1.0 / args.delta_seconds, args.server_step, args.stream_latency, args.agent_time))
+    for name in ('in series', 'pipelined'):
+        world = make_world(args)
+        driver = TickDriver(world)
+        if name == 'pipelined':
+            agent_loop = FakePipelinedAgentLoop(args.duration, args.agent_time / 1000.0, driver)
+        else:
+            agent_loop = FakeAgentLoop(args.duration, args.agent_time / 1000.0)
+
+        start = time.time()
+        driver.run(agent_loop.tick)
+        wall_time = time.time() - start
+        print('  {:9s}: {:7.1f} frames/s, {:6.2f}x real time, {} agent steps for {} frames, '
+              'control latency {} frame'.format(name, agent_loop.steps / wall_time,
+                                                agent_loop.timestamp_last_run / wall_time, agent_loop.steps,
+                                                driver.ticks, 1 if name == 'pipelined' else 0))
+    return 0
+
+
+def main():
+    description = 'Benchmarks of the tick loops, against a fake synchronous world.\n'
+    parser = argparse.ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    world_parser = argparse.ArgumentParser(add_help=False)
+    world_parser.add_argument('--duration', type=float, default=30.0, help='Simulated seconds (default: 30)')
+    world_parser.add_argument('--delta-seconds', type=float, default=0.05)
+    world_parser.add_argument('--server-step', type=float, default=5.0,
+                              help='Time for the server to compute a frame, in ms (default: 5)')
+    world_parser.add_argument('--stream-latency', type=float, default=1.0,
+                              help='Delay before the snapshot of a frame reaches the client, in ms (default: 1)')
+    world_parser.add_argument('--rpc-cost', type=float, default=20.0,
+                              help='Client CPU of a world.get_snapshot() call, in us (default: 20)')
+    world_parser.add_argument('--agent-time', type=float, default=10.0,
+                              help='Time of an agent step, sleeping, in ms (default: 10)')
+    subparsers = parser.add_subparsers(dest='benchmark')
+
+    cpu_parser = subparsers.add_parser('cpu', parents=[world_parser],
+                                       help='CPU per simulated second, get_snapshot calls and frames ticked\n'
+                                            'of the polling loop and of the TickDriver')
+    cpu_parser.set_defaults(func=benchmark_cpu)
+
+    pipeline_parser = subparsers.add_parser('pipeline', parents=[world_parser],
+                                            help='Frames per second of the TickDriver, in series and pipelined')
+    pipeline_parser.set_defaults(func=benchmark_pipeline)
+
+    arguments = parser.parse_args()
+    return arguments.func(arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
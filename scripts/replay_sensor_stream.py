@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Replay a sensor recording (leaderboard_evaluator.py --record-sensors, or OP_BRIDGE_RECORD_SENSORS
+for the bridge) into an agent and report its throughput. No CARLA server is needed.
+"""
+
+from __future__ import print_function
+
+import argparse
+from argparse import RawTextHelpFormatter
+import importlib
+import os
+import sys
+import time
+
+import numpy as np
+
+from srunner.scenariomanager.timer import GameTime
+
+from leaderboard.envs.sensor_interface import SensorReceivedNoData
+from leaderboard.envs.sensor_recorder import SensorReplayer
+
+
+def replay(args):
+    replayer = SensorReplayer(args.recording)
+
+    module_name = os.path.basename(args.agent).split('.')[0]
+    sys.path.insert(0, os.path.dirname(args.agent))
+    module_agent = importlib.import_module(module_name)
+    agent_class_name = getattr(module_agent, 'get_entry_point')()
+    agent = getattr(module_agent, agent_class_name)(args.agent_config)
+
+    replayer.register_sensors(agent.sensor_interface)
+    if replayer.partial_frames():
+        print('Skipping {} frames without a reading of every sensor'.format(len(replayer.partial_frames())))
+
+    GameTime.restart()
+    step_times = []
+    start = time.time()
+    try:
+        for timestamp in replayer.replay(agent.sensor_interface, args.realtime, args.delta_seconds):
+            GameTime.on_carla_tick(timestamp)
+
+            step_start = time.time()
+            agent()
+            step_times.append(time.time() - step_start)
+    except SensorReceivedNoData as e:
+        print('[Error] Stopping the replay at frame {}: {}'.format(timestamp.frame, e))
+    total_time = time.time() - start
+
+    agent.destroy()
+
+    if not step_times:
+        print('[Error] The recording [{}] has no readings.'.format(args.recording))
+        return -1
+
+    step_times = np.array(step_times) * 1000.0
+    print('Replayed {} frames of {} sensors in {:.3f} s ({:.1f} frames/s)'.format(
+        len(step_times), len(replayer.sensors()), total_time, len(step_times) / total_time))
+    print('  agent step: mean {:.3f} ms, p50 {:.3f} ms, p95 {:.3f} ms, p99 {:.3f} ms'.format(
+        step_times.mean(), np.percentile(step_times, 50), np.percentile(step_times, 95),
+        np.percentile(step_times, 99)))
+    return 0
+
+
+def main():
+    description = 'Replay a sensor recording into an agent and report its throughput.\n'
+    parser = argparse.ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('recording', help='Folder written by the SensorRecorder')
+    parser.add_argument("-a", "--agent", type=str, help="Path to Agent's py file to replay into", required=True)
+    parser.add_argument("--agent-config", type=str, help="Path to Agent's configuration file", default="")
+    parser.add_argument('--realtime', action='store_true',
+                        help='Feed the readings at the pace they were recorded instead of as fast as possible')
+    parser.add_argument('--delta-seconds', type=float, default=0.05,
+                        help='Simulation time between two frames (default: 0.05)')
+    arguments = parser.parse_args()
+
+    return replay(arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Checks of the SensorInterface buffers, fed by synthetic producers. No simulator is needed, but the
+CARLA and scenario runner python APIs must be importable.
+"""
+
+import threading
+import time
+import unittest
+
+try:
+    from leaderboard.envs.sensor_interface import SensorConfigurationInvalid, SensorInterface, SensorReceivedNoData
+except ImportError:
+    SensorInterface = None
+
+
+def make_interface(policy, buffer_size=2, timeout=1.0):
+    sensor_interface = SensorInterface()
+    sensor_interface.register_sensor('Center', 'sensor.camera.rgb', None)
+    sensor_interface.set_overflow_policy('Center', buffer_size, policy, timeout)
+    return sensor_interface
+
+
+def buffered_frames(sensor_interface, tag='Center'):
+    return sorted(sensor_interface._data_buffers[tag])  # pylint: disable=protected-access
+
+
+@unittest.skipIf(SensorInterface is None, 'the CARLA and scenario runner python APIs are needed')
+class OverflowPolicyTest(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        sensor_interface = make_interface('drop_oldest')
+        for frame in range(1, 6):
+            sensor_interface.update_sensor('Center', frame, frame)
+
+        self.assertEqual(buffered_frames(sensor_interface), [4, 5])
+        self.assertEqual(sensor_interface.get_dropped(), {'Center': 3})
+        self.assertEqual(sensor_interface.get_data(5)['Center'], (5, 5))
+
+    def test_keep_latest(self):
+        sensor_interface = make_interface('keep_latest')
+        for frame in range(1, 6):
+            sensor_interface.update_sensor('Center', frame, frame)
+
+        self.assertEqual(buffered_frames(sensor_interface), [5])
+        self.assertEqual(sensor_interface.get_dropped(), {'Center': 4})
+        self.assertEqual(sensor_interface.get_data(5)['Center'], (5, 5))
+
+    def test_block_timeout(self):
+        sensor_interface = make_interface('block', timeout=0.1)
+        sensor_interface.update_sensor('Center', 1, 1)
+        sensor_interface.update_sensor('Center', 2, 2)
+
+        start = time.time()
+        sensor_interface.update_sensor('Center', 3, 3)
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+        # The new reading is the one dropped
+        self.assertEqual(buffered_frames(sensor_interface), [1, 2])
+        self.assertEqual(sensor_interface.get_dropped(), {'Center': 1})
+
+    def test_block_until_consumed(self):
+        sensor_interface = make_interface('block', timeout=5.0)
+        sensor_interface.update_sensor('Center', 1, 1)
+        sensor_interface.update_sensor('Center', 2, 2)
+
+        consumer = threading.Timer(0.1, sensor_interface.get_data, (1,))
+        consumer.start()
+        sensor_interface.update_sensor('Center', 3, 3)
+        consumer.join()
+
+        self.assertEqual(buffered_frames(sensor_interface), [2, 3])
+        self.assertEqual(sensor_interface.get_dropped(), {'Center': 0})
+
+    def test_slow_consumer(self):
+        """
+        A producer running ahead of the agent never buffers more than buffer_size readings
+        """
+        for policy in ('keep_latest', 'drop_oldest'):
+            sensor_interface = make_interface(policy, buffer_size=3)
+            for frame in range(1, 201):
+                sensor_interface.update_sensor('Center', frame, frame)
+                if frame % 10 == 0:
+                    self.assertEqual(sensor_interface.get_data(frame)['Center'], (frame, frame))
+
+            statistics = sensor_interface.get_statistics()['Center']
+            self.assertLessEqual(statistics['max_queue_depth'], 3)
+            self.assertEqual(statistics['queue_depth'], 0)
+
+    def test_missing_frame(self):
+        sensor_interface = make_interface('drop_oldest')
+        sensor_interface._queue_timeout = 0.1  # pylint: disable=protected-access
+        sensor_interface.update_sensor('Center', 1, 1)
+        self.assertRaises(SensorReceivedNoData, sensor_interface.get_data, 2)
+
+
+@unittest.skipIf(SensorInterface is None, 'the CARLA and scenario runner python APIs are needed')
+class PseudoSensorTest(unittest.TestCase):
+
+    def make_interface(self, policy, buffer_size=1):
+        sensor_interface = make_interface('drop_oldest')
+        sensor_interface.register_sensor('Speed', 'sensor.speedometer', None)
+        sensor_interface.set_overflow_policy('Speed', buffer_size, policy, 0.5)
+        return sensor_interface
+
+    def test_slower_than_tick(self):
+        """
+        A 10 Hz speedometer on a 20 Hz world, its latest reading is handed over on the other frames
+        """
+        for policy in ('keep_latest', 'drop_oldest', 'block'):
+            sensor_interface = self.make_interface(policy)
+            for frame in range(1, 9):
+                sensor_interface.update_sensor('Center', frame, frame)
+                start = time.time()
+                if frame % 2 == 1:
+                    sensor_interface.update_sensor('Speed', {'speed': float(frame)}, frame)
+                # the reading kept to be handed over again doesn't fill the buffer
+                self.assertLess(time.time() - start, 0.5)
+
+                data = sensor_interface.get_data(frame)
+                self.assertEqual(data['Speed'], (frame - (frame + 1) % 2, {'speed': float(frame - (frame + 1) % 2)}))
+
+            self.assertEqual(sensor_interface.get_dropped(), {'Center': 0, 'Speed': 0})
+            self.assertEqual(sensor_interface.get_frame_skew(), {'Center': 0, 'Speed': 0})
+
+
+@unittest.skipIf(SensorInterface is None, 'the CARLA and scenario runner python APIs are needed')
+class PipelinedTest(unittest.TestCase):
+
+    def test_reject_dropping_policies(self):
+        sensor_interface = make_interface('keep_latest')
+        self.assertRaises(SensorConfigurationInvalid, sensor_interface.set_pipelined, True)
+
+        sensor_interface = make_interface('drop_oldest', buffer_size=1)
+        self.assertRaises(SensorConfigurationInvalid, sensor_interface.set_pipelined, True)
+
+        sensor_interface = make_interface('drop_oldest')
+        sensor_interface.set_pipelined(True)
+        self.assertRaises(SensorConfigurationInvalid, sensor_interface.set_overflow_policy, 'Center', 2,
+                          'keep_latest')
+        sensor_interface.set_overflow_policy('Center', 1, 'block')
+
+    def test_next_frame_arrives_first(self):
+        sensor_interface = make_interface('drop_oldest')
+        sensor_interface.set_pipelined(True)
+        sensor_interface.update_sensor('Center', 1, 1)
+        # the world ticked frame 2 before the agent asked for frame 1
+        sensor_interface.update_sensor('Center', 2, 2)
+
+        self.assertEqual(sensor_interface.get_data(1)['Center'], (1, 1))
+        self.assertEqual(sensor_interface.get_data(2)['Center'], (2, 2))
+        self.assertEqual(sensor_interface.get_dropped(), {'Center': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Round trip of a sensor stream through the SensorRecorder and the SensorReplayer
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    from leaderboard.envs.sensor_interface import SensorInterface
+    from leaderboard.envs.sensor_recorder import SensorRecorder, SensorReplayer
+except ImportError:
+    SensorInterface = None
+
+
+SENSORS = {'Center': 'sensor.camera.rgb', 'LIDAR': 'sensor.lidar.ray_cast', 'Speed': 'sensor.speedometer'}
+
+
+def camera_image(frame):
+    return np.full((4, 6, 4), frame, dtype=np.uint8)
+
+
+def lidar_cloud(frame):
+    return np.arange(frame, frame + 12, dtype=np.float32).reshape(3, 4)
+
+
+@unittest.skipIf(SensorInterface is None, 'the CARLA and scenario runner python APIs are needed')
+class RecordReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def record(self, frames):
+        sensor_interface = SensorInterface()
+        for tag, sensor_type in SENSORS.items():
+            sensor_interface.register_sensor(tag, sensor_type, None)
+        sensor_interface.set_recorder(SensorRecorder(self.path))
+
+        for frame in frames:
+            sensor_interface.update_sensor('Center', camera_image(frame), frame)
+            sensor_interface.update_sensor('LIDAR', lidar_cloud(frame), frame)
+            if frame % 2 == 1:
+                sensor_interface.update_sensor('Speed', {'speed': float(frame)}, frame)
+            sensor_interface.get_data(frame)
+
+        # The recording stops while the next frame is being received
+        sensor_interface.update_sensor('Center', camera_image(frames[-1] + 1), frames[-1] + 1)
+        sensor_interface.set_recorder(None)
+
+    def test_round_trip(self):
+        self.record(range(1, 6))
+
+        replayer = SensorReplayer(self.path)
+        self.assertEqual(replayer.sensors(), SENSORS)
+        self.assertEqual(replayer.frames(), [1, 2, 3, 4, 5])
+        self.assertEqual(replayer.partial_frames(), [6])
+
+        sensor_interface = SensorInterface()
+        sensor_interface._queue_timeout = 1.0  # pylint: disable=protected-access
+        replayer.register_sensors(sensor_interface)
+
+        replayed = []
+        for timestamp in replayer.replay(sensor_interface):
+            data = sensor_interface.get_data(timestamp.frame)
+            frame = timestamp.frame
+            replayed.append(frame)
+
+            self.assertEqual(data['Center'][0], frame)
+            np.testing.assert_array_equal(data['Center'][1], camera_image(frame))
+            np.testing.assert_array_equal(data['LIDAR'][1], lidar_cloud(frame))
+            # Odd frames only, the even ones get the previous reading
+            self.assertEqual(data['Speed'][1], {'speed': float(frame - (frame + 1) % 2)})
+
+        self.assertEqual(replayed, [1, 2, 3, 4, 5])
+        self.assertEqual(sensor_interface.get_dropped(), {'Center': 0, 'LIDAR': 0, 'Speed': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
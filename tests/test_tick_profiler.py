@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# This work is licensed under the terms of the MIT license.
+# For a copy, see <https://opensource.org/licenses/MIT>.
+
+"""
+Checks of the TickProfiler statistics and Chrome trace
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from leaderboard.utils.tick_profiler import TickProfiler
+
+
+class TickProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_disabled(self):
+        profiler = TickProfiler(False)
+        profiler.record('agent', time.time())
+        self.assertEqual(profiler.get_statistics(), {})
+
+    def test_statistics_without_trace(self):
+        profiler = TickProfiler()
+        start = time.time()
+        for _ in range(10):
+            profiler.record('agent', start, start + 0.002)
+
+        self.assertEqual(profiler.get_statistics()['agent']['count'], 10)
+        trace_path = os.path.join(self.path, 'trace.json')
+        profiler.write_trace(trace_path)
+        with open(trace_path) as fd:
+            self.assertEqual(json.load(fd)['traceEvents'], [])
+
+    def test_trace_threads(self):
+        profiler = TickProfiler(trace=True)
+        start = time.time()
+        profiler.record('agent', start, start + 0.002)
+
+        tick_thread = threading.Thread(target=lambda: None, name='world_tick')
+        tick_thread.start()
+        tick_thread.join()
+        profiler.record('world_tick', start, start + 0.005, tick_thread)
+
+        self.assertEqual(profiler.get_statistics()['agent']['count'], 1)
+        self.assertEqual(profiler.get_statistics()['world_tick']['count'], 1)
+
+        trace_path = os.path.join(self.path, 'trace.json')
+        profiler.write_trace(trace_path)
+        with open(trace_path) as fd:
+            events = json.load(fd)['traceEvents']
+
+        spans = dict((event['name'], event) for event in events if event['ph'] == 'X')
+        self.assertEqual(spans['agent']['tid'], threading.current_thread().ident)
+        self.assertEqual(spans['world_tick']['tid'], tick_thread.ident)
+        self.assertAlmostEqual(spans['world_tick']['dur'], 5000.0, delta=1.0)
+
+        names = dict((event['tid'], event['args']['name']) for event in events if event['ph'] == 'M')
+        self.assertEqual(names[tick_thread.ident], 'world_tick')
+
+
+if __name__ == '__main__':
+    unittest.main()